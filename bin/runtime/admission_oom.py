@@ -0,0 +1,193 @@
+import logging
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from watchdog_oom import CGROUP_ROOT, find_cgroup_dir
+
+logger = logging.getLogger(__name__)
+
+PSI_STALL_US = 150000
+PSI_WINDOW_US = 1000000
+PSI_AVG10_THRESHOLD = 5.0
+PRESSURE_EVENTS = ("oom", "oom_kill")
+
+
+def read_psi_avg10(path: str) -> Optional[float]:
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if line.startswith("some "):
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+                        if key == "avg10":
+                            return float(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_memory_events(path: str) -> Dict[str, int]:
+    events = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                key, _, value = line.partition(" ")
+                if key in PRESSURE_EVENTS:
+                    events[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return events
+
+
+class StaticAdmission:
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.limit = max_workers
+
+    def admit(self, running: int) -> bool:
+        return running < self.limit
+
+    def completed(self):
+        pass
+
+    def add_listener(self, callback: Callable[[], None]):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class AdmissionController(StaticAdmission):
+    def __init__(
+        self,
+        max_workers: int,
+        cgroup_dir: str,
+        poll_interval: float = 0.5,
+        shrink_cooldown: float = 2.0,
+        grow_after: float = 5.0,
+        avg10_threshold: float = PSI_AVG10_THRESHOLD,
+    ):
+        super().__init__(max_workers)
+        self.cgroup_dir = cgroup_dir
+        self.pressure_path = f"{cgroup_dir}/memory.pressure"
+        self.events_path = f"{cgroup_dir}/memory.events"
+        self.poll_interval = poll_interval
+        self.shrink_cooldown = shrink_cooldown
+        self.grow_after = grow_after
+        self.avg10_threshold = avg10_threshold
+        self.lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self._events = read_memory_events(self.events_path)
+        self._last_change = 0.0
+        self._calm_since = time.time()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, callback: Callable[[], None]):
+        with self.lock:
+            self._listeners.append(callback)
+
+    def _open_trigger(self) -> Optional[int]:
+        if not os.path.realpath(self.pressure_path).startswith(f"{CGROUP_ROOT}/"):
+            return None
+        try:
+            fd = os.open(self.pressure_path, os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            return None
+        try:
+            os.write(fd, f"some {PSI_STALL_US} {PSI_WINDOW_US}\0".encode())
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _events_fired(self) -> bool:
+        events = read_memory_events(self.events_path)
+        fired = any(events.get(k, 0) > self._events.get(k, 0) for k in events)
+        self._events = events
+        return fired
+
+    def under_pressure(self) -> bool:
+        avg10 = read_psi_avg10(self.pressure_path)
+        fired = self._events_fired()
+        return fired or (avg10 is not None and avg10 > self.avg10_threshold)
+
+    def shrink(self):
+        now = time.time()
+        with self.lock:
+            self._calm_since = now
+            if self.limit == 1 or now - self._last_change < self.shrink_cooldown:
+                return
+            self.limit = max(1, self.limit // 2)
+            self._last_change = now
+        logger.warning(f"[admission] Memory pressure, limiting to {self.limit} workers")
+
+    def grow(self):
+        now = time.time()
+        with self.lock:
+            if (
+                self.limit >= self.max_workers
+                or now - self._calm_since < self.grow_after
+            ):
+                return
+            self.limit += 1
+            self._calm_since = now
+            self._last_change = now
+            listeners = list(self._listeners)
+        logger.info(f"[admission] Pressure cleared, allowing {self.limit} workers")
+        for callback in listeners:
+            callback()
+
+    def _loop(self):
+        fd = self._open_trigger()
+        poller = None
+        if fd is not None:
+            poller = select.poll()
+            poller.register(fd, select.POLLPRI)
+        try:
+            while not self._stop_event.is_set():
+                triggered = False
+                if poller is not None:
+                    for _, event in poller.poll(self.poll_interval * 1000):
+                        if event & select.POLLERR:
+                            poller = None
+                            break
+                        triggered = bool(event & select.POLLPRI)
+                else:
+                    self._stop_event.wait(self.poll_interval)
+                if self.under_pressure():
+                    self.shrink()
+                elif not triggered:
+                    self.grow()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        logger.info(
+            f"[admission] Watching {self.pressure_path} (workers 1-{self.max_workers})"
+        )
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+
+def create_admission_controller(
+    max_workers: int, disable: bool, cgroup_dir: Optional[str] = None
+) -> StaticAdmission:
+    if disable:
+        return StaticAdmission(max_workers)
+    cgroup_dir = cgroup_dir or find_cgroup_dir()
+    if cgroup_dir is None or not os.path.exists(f"{cgroup_dir}/memory.pressure"):
+        return StaticAdmission(max_workers)
+    return AdmissionController(max_workers, cgroup_dir)
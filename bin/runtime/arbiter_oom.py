@@ -0,0 +1,226 @@
+import fcntl
+import json
+import logging
+import os
+import select
+import signal
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from kill_policy_oom import RESUME_SETTLE, KillDecision, KillPolicy
+from result_store_oom import write_json_atomic
+from scheduler_oom import PIDFD_AVAILABLE, wait_for_pid
+
+logger = logging.getLogger(__name__)
+
+ARBITER_DIR = os.environ.get(
+    "TIG_POOL_ARBITER_DIR",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        f"tig-pool-arbiter-{os.getuid()}",
+    ),
+)
+BOARD_TTL = 2.0
+BOARD_INTERVAL = 0.25
+
+
+@dataclass
+class Candidate:
+    owner: int
+    kind: str
+    nonce: int
+    pid: int
+    memory: int
+    age: float
+    score: float
+    start: int = 0
+
+    @property
+    def oom_score(self) -> float:
+        return self.score
+
+
+def proc_identity(pid: int) -> Optional[tuple[int, int]]:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        return int(fields[1]), int(fields[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class RemoteProcess:
+    def __init__(self, pid: int, pidfd: Optional[int] = None):
+        self.pid = pid
+        self.pidfd = pidfd
+
+    def signal(self, sig: int):
+        if self.pidfd is not None:
+            signal.pidfd_send_signal(self.pidfd, sig)
+        else:
+            os.kill(self.pid, sig)
+
+    def wait(self, timeout: float) -> bool:
+        if self.pidfd is None:
+            return wait_for_pid(self.pid, timeout)
+        poller = select.poll()
+        poller.register(self.pidfd, select.POLLIN)
+        return bool(poller.poll(timeout * 1000))
+
+    def close(self):
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+
+def open_candidate(candidate: Candidate) -> Optional[RemoteProcess]:
+    pidfd = None
+    if PIDFD_AVAILABLE:
+        try:
+            pidfd = os.pidfd_open(candidate.pid)
+        except ProcessLookupError:
+            return None
+        except OSError:
+            pidfd = None
+    if proc_identity(candidate.pid) != (candidate.owner, candidate.start):
+        if pidfd is not None:
+            os.close(pidfd)
+        return None
+    return RemoteProcess(candidate.pid, pidfd)
+
+
+class OOMArbiter:
+    def __init__(self, scope: str, directory: str = ARBITER_DIR):
+        self.directory = f"{directory}/{scope}"
+        self.owner = os.getpid()
+        self.board_path = f"{self.directory}/{self.owner}.json"
+        self.lock_path = f"{self.directory}/round.lock"
+        self.last_publish = 0.0
+        self._starts: Dict[int, int] = {}
+        self.publish([])
+
+    def _start(self, pid: int) -> int:
+        if pid not in self._starts:
+            identity = proc_identity(pid)
+            self._starts[pid] = identity[1] if identity else 0
+        return self._starts[pid]
+
+    def publish(self, tasks: Sequence) -> None:
+        self.last_publish = time.time()
+        tasks = [t for t in tasks if t.process is not None]
+        self._starts = {t.process.pid: self._start(t.process.pid) for t in tasks}
+        board = {
+            "owner": self.owner,
+            "t": time.time(),
+            "tasks": [
+                [
+                    t.nonce,
+                    t.kind,
+                    t.process.pid,
+                    t.memory,
+                    t.age,
+                    t.oom_score,
+                    self._starts[t.process.pid],
+                ]
+                for t in tasks
+            ],
+        }
+        try:
+            write_json_atomic(self.board_path, board)
+        except FileNotFoundError:
+            os.makedirs(self.directory, exist_ok=True)
+            write_json_atomic(self.board_path, board)
+
+    def has_peers(self) -> bool:
+        try:
+            with os.scandir(self.directory) as entries:
+                return any(
+                    e.name.endswith(".json") and e.path != self.board_path
+                    for e in entries
+                )
+        except OSError:
+            return False
+
+    def candidates(self) -> List[Candidate]:
+        candidates = []
+        now = time.time()
+        with os.scandir(self.directory) as entries:
+            paths = [e.path for e in entries if e.name.endswith(".json")]
+        for path in paths:
+            try:
+                with open(path, "r") as f:
+                    board = json.load(f)
+            except (OSError, ValueError):
+                continue
+            owner = board.get("owner", 0)
+            if owner != self.owner and not _alive(owner):
+                _unlink(path)
+                continue
+            if now - board.get("t", 0) > BOARD_TTL:
+                continue
+            for nonce, kind, pid, memory, age, score, *start in board.get("tasks", []):
+                candidates.append(
+                    Candidate(owner, kind, nonce, pid, memory, age, score, *start)
+                )
+        return candidates
+
+    def plan(self, policy: KillPolicy, usage: float, total_bytes: int) -> KillDecision:
+        return policy.plan(usage, total_bytes, self.candidates())
+
+    @contextmanager
+    def round(self) -> Iterator[bool]:
+        with open(self.lock_path, "a+") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                lock_file.seek(0)
+                try:
+                    settled_at = float(lock_file.read() or 0)
+                except ValueError:
+                    settled_at = 0.0
+                if time.time() < settled_at:
+                    yield False
+                    return
+                yield True
+                try:
+                    lock_file.truncate(0)
+                    lock_file.write(str(time.time() + RESUME_SETTLE))
+                    lock_file.flush()
+                except OSError:
+                    pass
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        _unlink(self.board_path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def create_arbiter(scope: str) -> Optional[OOMArbiter]:
+    try:
+        return OOMArbiter(scope)
+    except OSError as e:
+        logger.warning(f"OOM arbiter unavailable: {e}")
+        return None
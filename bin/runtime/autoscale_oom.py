@@ -0,0 +1,204 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from admission_oom import StaticAdmission
+from profile_oom import challenge_algorithm
+from result_store_oom import write_json_atomic
+from watchdog_oom import BaseWatchdog
+
+logger = logging.getLogger(__name__)
+
+AUTOSCALE_PATH = os.environ.get(
+    "TIG_POOL_AUTOSCALE_PATH",
+    os.path.expanduser("~/.cache/tig-pool/autoscale.json"),
+)
+MAX_ENTRIES = 64
+MIN_WINDOW = 10.0
+MIN_GAIN = 0.05
+POLL_INTERVAL = 0.5
+
+
+def autoscale_key(settings_json: str, so_path: str, mode: str) -> str:
+    challenge, algorithm = challenge_algorithm(settings_json, so_path)
+    return f"{challenge}/{algorithm}/{mode}/{socket.gethostname()}"
+
+
+def load_entries(path: str = AUTOSCALE_PATH) -> Dict[str, dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("entries", {})
+    except (OSError, ValueError):
+        return {}
+
+
+class Autoscaler(StaticAdmission):
+    def __init__(
+        self,
+        admission: StaticAdmission,
+        watchdog: BaseWatchdog,
+        key: str,
+        high_watermark: float = 0.90,
+        path: str = AUTOSCALE_PATH,
+        min_window: float = MIN_WINDOW,
+    ):
+        super().__init__(admission.max_workers)
+        self.admission = admission
+        self.watchdog = watchdog
+        self.key = key
+        self.high_watermark = high_watermark
+        self.path = path
+        self.min_window = min_window
+        self.lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        cached = load_entries(path).get(key, {}).get("workers")
+        if cached:
+            self.limit = max(1, min(int(cached), self.max_workers))
+        else:
+            self.limit = max(1, self.max_workers // 4)
+        self.ceiling = self.max_workers
+        self.best_limit = self.limit
+        self.best_rate = 0.0
+        self.settled = False
+        self._completed = 0
+        self._kills = 0
+        self._saturated = False
+        self._warmup = True
+        self._window_start = time.time()
+        self._last_backoff = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        watchdog.add_event_listener(self.on_event)
+
+    def admit(self, running: int) -> bool:
+        if running >= self.limit:
+            self._saturated = True
+            return False
+        return self.admission.admit(running)
+
+    def add_listener(self, callback: Callable[[], None]):
+        with self.lock:
+            self._listeners.append(callback)
+        self.admission.add_listener(callback)
+
+    def on_event(self, record: Dict[str, Any]):
+        if record["event"] == "kill":
+            with self.lock:
+                self._kills += 1
+
+    def completed(self):
+        with self.lock:
+            self._completed += 1
+
+    def _reset_window(self):
+        self._completed = 0
+        self._kills = 0
+        self._saturated = False
+        self._window_start = time.time()
+
+    def _set_limit(self, limit: int, reason: str):
+        if limit == self.limit:
+            return
+        grew = limit > self.limit
+        self.limit = limit
+        self._warmup = True
+        logger.info(f"[autoscale] {reason}, using {limit}/{self.max_workers} workers")
+        if grew:
+            for callback in list(self._listeners):
+                callback()
+
+    def step(self):
+        with self.lock:
+            elapsed = time.time() - self._window_start
+            completed, kills, saturated = self._completed, self._kills, self._saturated
+            pressure = self.watchdog.get_memory_usage() > self.high_watermark
+            if (
+                kills or pressure
+            ) and time.time() - self._last_backoff >= self.min_window:
+                self._last_backoff = time.time()
+                self.ceiling = max(1, self.limit - 1)
+                self.best_limit = min(self.best_limit, self.ceiling)
+                self.settled = True
+                self._reset_window()
+                self._set_limit(
+                    self.best_limit,
+                    f"{kills} kills" if kills else "Memory pressure",
+                )
+                return
+            if elapsed < self.min_window or completed < 2 * self.limit:
+                return
+            self._reset_window()
+            if self._warmup or not saturated:
+                self._warmup = False
+                return
+            rate = completed / elapsed
+            if rate > self.best_rate * (1 + MIN_GAIN):
+                self.best_limit, self.best_rate = self.limit, rate
+                if not self.settled and self.limit < self.ceiling:
+                    self._set_limit(self.limit + 1, f"{rate:.2f} nonces/s")
+                return
+            self.settled = True
+            self._set_limit(
+                self.best_limit, f"Plateau at {self.best_rate:.2f} nonces/s"
+            )
+
+    def _loop(self):
+        while not self._stop_event.wait(POLL_INTERVAL):
+            self.step()
+
+    def start(self):
+        self.admission.start()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        logger.info(
+            f"[autoscale] {self.key}: starting at {self.limit}/{self.max_workers} workers"
+        )
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.admission.stop()
+        if self.best_rate > 0:
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = load_entries(self.path)
+            entries.pop(self.key, None)
+            entries[self.key] = {
+                "workers": self.best_limit,
+                "rate": round(self.best_rate, 4),
+                "updated": time.time(),
+            }
+            if len(entries) > MAX_ENTRIES:
+                keep = sorted(entries, key=lambda k: entries[k].get("updated", 0))
+                for key in keep[: len(entries) - MAX_ENTRIES]:
+                    del entries[key]
+            write_json_atomic(self.path, {"entries": entries})
+
+
+def create_autoscaler(
+    admission: StaticAdmission,
+    watchdog: BaseWatchdog,
+    settings_json: str,
+    so_path: str,
+    mode: str,
+    enable: bool,
+    high_watermark: float = 0.90,
+) -> StaticAdmission:
+    if not enable:
+        return admission
+    return Autoscaler(
+        admission,
+        watchdog,
+        autoscale_key(settings_json, so_path, mode),
+        high_watermark,
+    )
@@ -1,34 +1,59 @@
 import argparse
-import json
 import logging
 import os
 import subprocess
 import sys
 import time
-from concurrent.futures import (
-    ThreadPoolExecutor,
-    Future,
-    wait,
-    ALL_COMPLETED,
-    FIRST_EXCEPTION,
-)
-from typing import Dict, Optional, Set
-
-from watchdog_oom import create_watchdog, BaseWatchdog
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set
 
-logging.basicConfig(
-    level=logging.INFO, format="[batch_processor] %(message)s", stream=sys.stdout
+from batch_tig_verifier_oom import verify_nonce, logger as verifier_logger
+from scheduler_oom import (
+    PRIORITY_FRESH,
+    PRIORITY_RETRY,
+    PRIORITY_VERIFY,
+    RETRY_OUTCOMES,
+    ChildExit,
+    CompletionQueue,
+    PendingQueue,
+    ProcessReaper,
+    has_oom_message,
+    remaining_time,
+    resolved_future,
 )
+from result_store_oom import (
+    RESULT_STORES,
+    QualityIndex,
+    ResultStore,
+    bitmap_test,
+    create_result_store,
+    write_json_atomic,
+)
+from admission_oom import create_admission_controller
+from autoscale_oom import create_autoscaler
+from kill_policy_oom import KILL_BUDGET, KILL_WINDOW, PRESSURE_ACTIONS
+from metrics_oom import create_metrics
+from nonce_order_oom import NONCE_ORDERS, create_nonce_order, shard_range
+from nonce_trace_oom import NonceTrace, create_nonce_trace
+from placement_oom import PLACEMENTS, create_placement
+from profile_oom import FootprintProfile, create_profile, size_workers
+from services_oom import stop_services
+from watchdog_oom import create_watchdog
+
 logger = logging.getLogger(__name__)
 
+RUNTIME_BIN = os.environ.get("TIG_POOL_RUNTIME_BIN", "tig-pool-runtime")
+EXPLO_DRAINS = ("abandon", "wait")
+
 
 def process_single_nonce(
+    reaper: ProcessReaper,
     nonce: int,
     settings_json: str,
     rand_hash: str,
     so_path: str,
     max_fuel: int,
-    output_dir: str,
+    store: ResultStore,
     ptx_path: Optional[str] = None,
     gpu_id: Optional[int] = None,
     data_encrypted: Optional[str] = None,
@@ -36,76 +61,89 @@ def process_single_nonce(
     timeout: int = 0,
     verbose: bool = False,
     stop_on_error: bool = True,
-    watchdog: Optional[BaseWatchdog] = None,
-) -> tuple[int, Optional[str]]:
-    output_file = f"{output_dir}/{nonce}.json"
-    if os.path.exists(output_file):
-        if verbose:
-            logger.debug(f"nonce {nonce}: already computed")
-        return (nonce, None)
+    commit_result: bool = True,
+    profile: Optional[FootprintProfile] = None,
+    trace: Optional[NonceTrace] = None,
+) -> tuple[Future, Optional[subprocess.Popen]]:
+    runtime_cmd = [
+        RUNTIME_BIN,
+        settings_json,
+        rand_hash,
+        str(nonce),
+        so_path,
+        "--fuel",
+        str(max_fuel),
+        "--output",
+        store.partial_dir,
+    ]
+    if data_encrypted:
+        runtime_cmd += ["--data", data_encrypted]
+    if hyperparameters:
+        runtime_cmd += ["--hyperparameters", hyperparameters]
+    if ptx_path:
+        runtime_cmd += ["--ptx", ptx_path]
+    if gpu_id is not None:
+        runtime_cmd += ["--gpu", str(gpu_id)]
+    elif ptx_path:
+        runtime_cmd += ["--gpu", "0"]
 
-    try:
-        runtime_cmd = [
-            "tig-pool-runtime",
-            settings_json,
-            rand_hash,
-            str(nonce),
-            so_path,
-            "--fuel",
-            str(max_fuel),
-            "--output",
-            output_dir,
-        ]
-        if data_encrypted:
-            runtime_cmd += ["--data", data_encrypted]
-        if hyperparameters:
-            runtime_cmd += ["--hyperparameters", hyperparameters]
-        if ptx_path:
-            runtime_cmd += ["--ptx", ptx_path]
-        if gpu_id is not None:
-            runtime_cmd += ["--gpu", str(gpu_id)]
-        elif ptx_path:
-            runtime_cmd += ["--gpu", "0"]
-
-        process = subprocess.Popen(
-            runtime_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        if watchdog:
-            watchdog.set_process(nonce, process)
+    def on_error(e: Exception) -> tuple[int, Optional[str]]:
+        error_msg = str(e)
+        print(f"nonce {nonce}: {error_msg}", file=sys.stderr)
+        if stop_on_error:
+            write_json_atomic(
+                store.report_path("result"), {"error": f"nonce {nonce}: {error_msg}"}
+            )
+            raise e
+        return (nonce, error_msg)
 
+    def on_exit(child: ChildExit) -> tuple[int, Optional[str]]:
         try:
-            stdout, stderr = process.communicate(
-                timeout=timeout if timeout > 0 else None
-            )
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.communicate()
-            raise
+            if child.returncode != 0:
+                store.discard_partial(nonce)
 
-        if process.returncode in (-15, -9):
-            return (nonce, "killed_by_oom")
+            if child.abandoned:
+                return (nonce, "abandoned")
 
-        if verbose:
-            logger.debug(f"nonce {nonce}: exit code {process.returncode}")
+            if child.timed_out:
+                raise subprocess.TimeoutExpired(RUNTIME_BIN, timeout)
 
-        if not os.path.exists(output_file):
-            if process.returncode == 0:
-                raise Exception("no output")
-            stderr_str = stderr.decode(errors="ignore").strip()
-            if "OUT_OF_MEMORY" in stderr_str or "out of memory" in stderr_str.lower():
+            if child.aborted:
                 return (nonce, "cuda_oom")
-            raise Exception(f"exit {process.returncode}: {stderr_str}")
 
-        return (nonce, None)
+            if child.returncode in (-15, -9):
+                return (nonce, "killed_by_oom")
+
+            if verbose:
+                logger.debug(f"nonce {nonce}: exit code {child.returncode}")
+
+            if child.returncode != 0:
+                if has_oom_message(child.stderr):
+                    return (nonce, "cuda_oom")
+                stderr_str = child.stderr.decode(errors="ignore").strip()
+                raise Exception(f"exit {child.returncode}: {stderr_str}")
+
+            if not store.promote(nonce):
+                raise Exception("no output")
+
+            if commit_result:
+                store.commit(nonce)
+            if profile is not None and profile.memory_type == "RAM" and child.rusage:
+                profile.record(child.rusage.ru_maxrss * 1024)
+            return (nonce, None)
+
+        except Exception as e:
+            return on_error(e)
 
+    try:
+        return reaper.spawn(
+            runtime_cmd,
+            on_exit if trace is None else trace.wrap(nonce, "runtime", on_exit),
+            timeout if timeout > 0 else None,
+            has_oom_message,
+        )
     except Exception as e:
-        error_msg = str(e)
-        print(f"nonce {nonce}: {error_msg}", file=sys.stderr)
-        if stop_on_error:
-            with open(f"{output_dir}/result.json", "w") as f:
-                json.dump({"error": f"nonce {nonce}: {error_msg}"}, f)
-            raise
-        return (nonce, error_msg)
+        return resolved_future(on_error, e), None
 
 
 def process_runtime_batch(
@@ -128,6 +166,25 @@ def process_runtime_batch(
     mem_low: float = 0.75,
     mem_interval: float = 0.05,
     disable_oom: bool = False,
+    result_store: str = "files",
+    mem_trace: Optional[str] = None,
+    kill_budget: int = KILL_BUDGET,
+    kill_window: float = KILL_WINDOW,
+    pressure_action: str = "kill",
+    gpu_ids: Optional[List[int]] = None,
+    shared_sampler: bool = True,
+    arbiter: bool = True,
+    disable_profile: bool = False,
+    profile_path: Optional[str] = None,
+    disable_admission: bool = False,
+    cgroup_dir: Optional[str] = None,
+    nonce_order: str = "sequential",
+    nonce_trace: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    metrics_textfile: Optional[str] = None,
+    autoscale: bool = False,
+    placement: str = "none",
+    shard: Optional[str] = None,
 ) -> int:
     try:
         os.makedirs(output_dir, exist_ok=True)
@@ -136,75 +193,123 @@ def process_runtime_batch(
             logger.error(f"Cannot create output directory: {output_dir}")
             return 0
 
-    watchdog = create_watchdog(gpu_id, mem_high, mem_low, mem_interval, disable_oom)
+    try:
+        store = create_result_store(result_store, output_dir, shard)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 0
+    store.discard_partials()
+    watchdog = create_watchdog(
+        gpu_id,
+        mem_high,
+        mem_low,
+        mem_interval,
+        disable_oom,
+        mem_trace,
+        kill_budget,
+        kill_window,
+        pressure_action,
+        gpu_ids,
+        shared_sampler,
+        arbiter,
+    )
     watchdog.start()
+    profile = create_profile(
+        settings_json, so_path, watchdog, disable_profile, profile_path
+    )
+    max_workers = size_workers(profile, watchdog, max_workers, mem_high)
+    metrics = create_metrics(watchdog, "runtime", metrics_port, metrics_textfile)
+    trace = create_nonce_trace(
+        nonce_trace,
+        metrics,
+        mode="runtime",
+        settings=settings_json,
+        so_path=so_path,
+        max_fuel=max_fuel,
+        hyperparameters=hyperparameters,
+        start_nonce=start_nonce,
+        max_workers=max_workers,
+    )
+    admission = create_admission_controller(max_workers, disable_admission, cgroup_dir)
+    admission = create_autoscaler(
+        admission, watchdog, settings_json, so_path, "runtime", autoscale, mem_high
+    )
+    admission.start()
 
-    success_count = 0
+    computed = store.scan_computed(start_nonce, num_nonces)
+    pending_nonces = PendingQueue(
+        nonce
+        for nonce in create_nonce_order(nonce_order, start_nonce, num_nonces)
+        if not bitmap_test(computed, nonce - start_nonce)
+    )
+    success_count = num_nonces - len(pending_nonces)
+    if success_count:
+        logger.info(f"Resuming batch: {success_count} nonces already computed")
     errors = {}
-    pending_nonces = set(range(start_nonce, start_nonce + num_nonces))
     completed_nonces: Set[int] = set()
-    batch_start_time = time.time() if timeout > 0 else None
+    deadline = time.time() + timeout if timeout > 0 else None
     futures_map: Dict[Future, int] = {}
+    completions = CompletionQueue()
+    if metrics is not None:
+        metrics.track(
+            in_flight=lambda: len(futures_map), pending=lambda: len(pending_nonces)
+        )
+    watchdog.add_restart_listener(completions.notify)
+    admission.add_listener(completions.notify)
 
     try:
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with ProcessReaper(create_placement(placement)) as reaper:
             while (
                 pending_nonces
                 or futures_map
                 or watchdog.get_pending_restart_count() > 0
             ):
-                if batch_start_time and (time.time() - batch_start_time) >= timeout:
+                if deadline and time.time() >= deadline:
                     logger.warning(f"Batch timeout ({timeout}s) reached")
                     break
 
-                for nonce in watchdog.get_nonces_to_restart():
-                    if nonce not in completed_nonces:
-                        pending_nonces.add(nonce)
+                if watchdog.get_pending_restart_count() > 0:
+                    for nonce in watchdog.get_nonces_to_restart():
+                        if nonce not in completed_nonces:
+                            pending_nonces.push(nonce, PRIORITY_RETRY)
 
-                while pending_nonces and len(futures_map) < max_workers:
-                    nonce = pending_nonces.pop()
-                    future = executor.submit(
-                        process_single_nonce,
+                while (
+                    pending_nonces
+                    and admission.admit(len(futures_map))
+                    and not watchdog.has_suspended()
+                ):
+                    nonce, priority = pending_nonces.pop()
+                    device = watchdog.pick_device(gpu_id)
+                    future, process = process_single_nonce(
+                        reaper,
                         nonce,
                         settings_json,
                         rand_hash,
                         so_path,
                         max_fuel,
-                        output_dir,
+                        store,
                         ptx_path,
-                        gpu_id,
+                        device,
                         data_encrypted,
                         hyperparameters,
                         timeout,
                         verbose,
                         stop_on_error,
-                        watchdog,
+                        profile=profile,
+                        trace=trace,
                     )
                     futures_map[future] = nonce
-                    watchdog.register_task(nonce, future)
+                    watchdog.register_task(
+                        nonce, future, process, priority, device=device
+                    )
+                    completions.watch(future)
 
-                if not futures_map:
-                    if watchdog.get_pending_restart_count() > 0:
-                        time.sleep(mem_interval * 2)
-                        continue
+                if not futures_map and watchdog.get_pending_restart_count() == 0:
                     break
 
-                wait_timeout = max(mem_interval * 5, 0.05)
-                if batch_start_time:
-                    remaining = timeout - (time.time() - batch_start_time)
-                    if remaining <= 0:
-                        break
-                    wait_timeout = min(wait_timeout, remaining)
-
-                done, _ = wait(
-                    futures_map.keys(),
-                    timeout=wait_timeout,
-                    return_when=FIRST_EXCEPTION if stop_on_error else ALL_COMPLETED,
-                )
-
-                for future in done:
+                for future in completions.wait(remaining_time(deadline)):
                     nonce = futures_map.pop(future)
-                    watchdog.unregister_task(nonce)
+                    task = watchdog.unregister_task(nonce)
                     if future.cancelled():
                         continue
                     try:
@@ -212,6 +317,9 @@ def process_runtime_batch(
                         if error_msg is None:
                             success_count += 1
                             completed_nonces.add(result_nonce)
+                            admission.completed()
+                            if profile is not None:
+                                profile.record_task(task)
                         elif error_msg in ("killed_by_oom", "cuda_oom"):
                             watchdog.queue_for_retry(result_nonce)
                         else:
@@ -221,7 +329,6 @@ def process_runtime_batch(
                     except Exception as e:
                         if stop_on_error:
                             logger.error(f"Critical exception on nonce {nonce}: {e}")
-                            executor.shutdown(wait=False, cancel_futures=True)
                             raise
                         errors[nonce] = str(e)
                         completed_nonces.add(nonce)
@@ -229,23 +336,20 @@ def process_runtime_batch(
     except Exception as e:
         logger.error(f"Batch failed: {e}")
     finally:
-        if futures_map:
-            logger.info(f"Cancelling {len(futures_map)} remaining tasks")
-            for future in futures_map:
-                future.cancel()
-        watchdog.stop()
+        stop_services(watchdog, admission, store, profile, trace, metrics)
 
     if errors:
-        with open(f"{output_dir}/result.json", "w") as f:
-            json.dump({"errors": errors}, f)
+        write_json_atomic(store.report_path("result"), {"errors": errors})
 
     logger.info(f"Completed {success_count}/{num_nonces} nonces")
     return success_count
 
 
-def process_explo_batch(
+def process_pipeline_batch(
     start_nonce: int,
+    num_nonces: int,
     max_workers: int,
+    verify_workers: int,
     settings_json: str,
     rand_hash: str,
     so_path: str,
@@ -257,15 +361,32 @@ def process_explo_batch(
     hyperparameters: Optional[str] = None,
     timeout: int = 0,
     verbose: bool = False,
+    stop_on_error: bool = True,
     mem_high: float = 0.90,
     mem_low: float = 0.75,
     mem_interval: float = 0.05,
     disable_oom: bool = False,
+    result_store: str = "files",
+    quality_index: bool = False,
+    mem_trace: Optional[str] = None,
+    kill_budget: int = KILL_BUDGET,
+    kill_window: float = KILL_WINDOW,
+    pressure_action: str = "kill",
+    gpu_ids: Optional[List[int]] = None,
+    shared_sampler: bool = True,
+    arbiter: bool = True,
+    disable_profile: bool = False,
+    profile_path: Optional[str] = None,
+    disable_admission: bool = False,
+    cgroup_dir: Optional[str] = None,
+    nonce_order: str = "sequential",
+    nonce_trace: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    metrics_textfile: Optional[str] = None,
+    autoscale: bool = False,
+    placement: str = "none",
+    shard: Optional[str] = None,
 ) -> int:
-    if timeout <= 0:
-        logger.error("timeout is required in explo mode")
-        return 0
-
     try:
         os.makedirs(output_dir, exist_ok=True)
     except PermissionError:
@@ -273,100 +394,454 @@ def process_explo_batch(
             logger.error(f"Cannot create output directory: {output_dir}")
             return 0
 
-    watchdog = create_watchdog(gpu_id, mem_high, mem_low, mem_interval, disable_oom)
+    try:
+        store = create_result_store(result_store, output_dir, shard)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 0
+    store.discard_partials()
+    qualities = (
+        QualityIndex(output_dir, start_nonce, num_nonces, shard)
+        if quality_index
+        else None
+    )
+    watchdog = create_watchdog(
+        gpu_id,
+        mem_high,
+        mem_low,
+        mem_interval,
+        disable_oom,
+        mem_trace,
+        kill_budget,
+        kill_window,
+        pressure_action,
+        gpu_ids,
+        shared_sampler,
+        arbiter,
+    )
     watchdog.start()
+    profile = create_profile(
+        settings_json, so_path, watchdog, disable_profile, profile_path
+    )
+    max_workers = size_workers(profile, watchdog, max_workers, mem_high)
+    metrics = create_metrics(watchdog, "runtime+verify", metrics_port, metrics_textfile)
+    trace = create_nonce_trace(
+        nonce_trace,
+        metrics,
+        mode="runtime+verify",
+        settings=settings_json,
+        so_path=so_path,
+        max_fuel=max_fuel,
+        hyperparameters=hyperparameters,
+        start_nonce=start_nonce,
+        max_workers=max_workers,
+    )
+    admission = create_admission_controller(max_workers, disable_admission, cgroup_dir)
+    admission = create_autoscaler(
+        admission,
+        watchdog,
+        settings_json,
+        so_path,
+        "runtime+verify",
+        autoscale,
+        mem_high,
+    )
+    admission.start()
 
-    start_time = time.time()
     success_count = 0
-    current_nonce = start_nonce
-    futures_map: Dict[Future, int] = {}
+    errors = {}
+    verify_errors = {}
+    pending_nonces = PendingQueue()
+    pending_verify = PendingQueue()
+    computed_nonces: Set[int] = set()
+    completed_nonces: Set[int] = set()
+    computed = store.scan_computed(start_nonce, num_nonces)
+    for nonce in create_nonce_order(nonce_order, start_nonce, num_nonces):
+        if not bitmap_test(computed, nonce - start_nonce):
+            pending_nonces.push(nonce, PRIORITY_FRESH)
+            continue
+        computed_nonces.add(nonce)
+        if qualities is not None and qualities.get(nonce) is not None:
+            success_count += 1
+            completed_nonces.add(nonce)
+        else:
+            pending_verify.push(nonce, PRIORITY_VERIFY)
+    if computed_nonces:
+        logger.info(
+            f"Resuming batch: {len(computed_nonces)} nonces already computed, {success_count} verified"
+        )
+    deadline = time.time() + timeout if timeout > 0 else None
+    runtime_futures: Dict[Future, int] = {}
+    verify_futures: Dict[Future, int] = {}
+    completions = CompletionQueue()
+    if metrics is not None:
+        metrics.track(
+            in_flight=lambda: len(runtime_futures) + len(verify_futures),
+            pending=lambda: len(pending_nonces) + len(pending_verify),
+        )
+    watchdog.add_restart_listener(completions.notify)
+    admission.add_listener(completions.notify)
 
     try:
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            while len(futures_map) < max_workers:
-                future = executor.submit(
-                    process_single_nonce,
-                    current_nonce,
-                    settings_json,
-                    rand_hash,
-                    so_path,
-                    max_fuel,
-                    output_dir,
-                    ptx_path,
-                    gpu_id,
-                    data_encrypted,
-                    hyperparameters,
-                    timeout,
-                    verbose,
-                    False,
-                    watchdog,
-                )
-                futures_map[future] = current_nonce
-                watchdog.register_task(current_nonce, future)
-                current_nonce += 1
-
-            while time.time() - start_time < timeout:
-                remaining_time = timeout - (time.time() - start_time)
-                if remaining_time <= 0:
+        with ProcessReaper(create_placement(placement)) as reaper:
+            while (
+                pending_nonces
+                or pending_verify
+                or runtime_futures
+                or verify_futures
+                or watchdog.get_pending_restart_count() > 0
+            ):
+                if deadline and time.time() >= deadline:
+                    logger.warning(f"Batch timeout ({timeout}s) reached")
                     break
 
-                retry_nonces = watchdog.get_nonces_to_restart()
-                wait_timeout = max(mem_interval * 5, 0.05)
-                done, _ = wait(
-                    futures_map.keys(), timeout=min(wait_timeout, remaining_time)
-                )
+                if watchdog.get_pending_restart_count() > 0:
+                    for nonce in watchdog.get_nonces_to_restart():
+                        if nonce in completed_nonces:
+                            continue
+                        if nonce in computed_nonces:
+                            pending_verify.push(nonce, PRIORITY_VERIFY + PRIORITY_RETRY)
+                        else:
+                            pending_nonces.push(nonce, PRIORITY_RETRY)
 
-                for future in done:
-                    nonce = futures_map.pop(future)
-                    watchdog.unregister_task(nonce)
-                    if future.cancelled():
+                while (
+                    pending_verify
+                    and len(verify_futures) < verify_workers
+                    and admission.admit(len(runtime_futures) + len(verify_futures))
+                    and not watchdog.has_suspended()
+                ):
+                    nonce, priority = pending_verify.pop()
+                    device = watchdog.pick_device(gpu_id)
+                    future, process = verify_nonce(
+                        reaper,
+                        nonce,
+                        settings_json,
+                        rand_hash,
+                        store,
+                        ptx_path,
+                        device,
+                        data_encrypted,
+                        verbose,
+                        qualities,
+                        trace,
+                    )
+                    verify_futures[future] = nonce
+                    watchdog.register_task(
+                        nonce, future, process, priority, device=device, kind="verify"
+                    )
+                    completions.watch(future)
+
+                while (
+                    pending_nonces
+                    and admission.admit(len(runtime_futures) + len(verify_futures))
+                    and not watchdog.has_suspended()
+                ):
+                    nonce, priority = pending_nonces.pop()
+                    device = watchdog.pick_device(gpu_id)
+                    future, process = process_single_nonce(
+                        reaper,
+                        nonce,
+                        settings_json,
+                        rand_hash,
+                        so_path,
+                        max_fuel,
+                        store,
+                        ptx_path,
+                        device,
+                        data_encrypted,
+                        hyperparameters,
+                        timeout,
+                        verbose,
+                        stop_on_error,
+                        commit_result=False,
+                        profile=profile,
+                        trace=trace,
+                    )
+                    runtime_futures[future] = nonce
+                    watchdog.register_task(
+                        nonce, future, process, priority, device=device
+                    )
+                    completions.watch(future)
+
+                if (
+                    not runtime_futures
+                    and not verify_futures
+                    and watchdog.get_pending_restart_count() == 0
+                ):
+                    break
+
+                for future in completions.wait(remaining_time(deadline)):
+                    if future in verify_futures:
+                        nonce = verify_futures.pop(future)
+                        watchdog.unregister_task(nonce)
+                        if future.cancelled():
+                            continue
+                        result_nonce, error_msg = future.result()
+                        if error_msg is None:
+                            success_count += 1
+                            completed_nonces.add(result_nonce)
+                            admission.completed()
+                        elif error_msg in ("killed_by_oom", "cuda_oom"):
+                            watchdog.queue_for_retry(result_nonce)
+                        else:
+                            verify_errors[result_nonce] = error_msg
+                            completed_nonces.add(result_nonce)
                         continue
 
-                    spawn_new = True
+                    nonce = runtime_futures.pop(future)
+                    task = watchdog.unregister_task(nonce)
+                    if future.cancelled():
+                        continue
                     try:
                         result_nonce, error_msg = future.result()
                         if error_msg is None:
-                            success_count += 1
+                            computed_nonces.add(result_nonce)
+                            if profile is not None:
+                                profile.record_task(task)
+                            pending_verify.push(result_nonce, PRIORITY_VERIFY)
                         elif error_msg in ("killed_by_oom", "cuda_oom"):
                             watchdog.queue_for_retry(result_nonce)
-                            spawn_new = False
+                        else:
+                            errors[result_nonce] = error_msg
+                            if not stop_on_error:
+                                completed_nonces.add(result_nonce)
                     except Exception as e:
-                        logger.error(f"nonce {nonce} raised exception: {e}")
+                        if stop_on_error:
+                            logger.error(f"Critical exception on nonce {nonce}: {e}")
+                            raise
+                        errors[nonce] = str(e)
+                        completed_nonces.add(nonce)
+
+    except Exception as e:
+        logger.error(f"Batch failed: {e}")
+    finally:
+        stop_services(watchdog, admission, store, profile, trace, metrics, qualities)
+
+    if errors:
+        write_json_atomic(store.report_path("result"), {"errors": errors})
+    if verify_errors:
+        write_json_atomic(
+            store.report_path("verifier_errors"), {"errors": verify_errors}
+        )
+
+    logger.info(
+        f"Completed {len(computed_nonces)}/{num_nonces} nonces, verified {success_count}/{num_nonces}"
+    )
+    return success_count
+
+
+def collect_explo_result(
+    future: Future,
+    futures_map: Dict[Future, int],
+    watchdog,
+    admission,
+    profile: Optional[FootprintProfile],
+) -> int:
+    nonce = futures_map.pop(future)
+    task = watchdog.unregister_task(nonce)
+    if future.cancelled():
+        return 0
+    try:
+        result_nonce, error_msg = future.result()
+    except Exception as e:
+        logger.error(f"nonce {nonce} raised exception: {e}")
+        return 0
+    if error_msg is None:
+        admission.completed()
+        if profile is not None:
+            profile.record_task(task)
+        return 1
+    if error_msg in RETRY_OUTCOMES:
+        watchdog.queue_for_retry(result_nonce)
+    return 0
 
-                    if spawn_new and time.time() - start_time < timeout:
-                        next_nonce = (
-                            retry_nonces.pop(0) if retry_nonces else current_nonce
-                        )
-                        if next_nonce == current_nonce:
+
+def process_explo_batch(
+    start_nonce: int,
+    max_workers: int,
+    settings_json: str,
+    rand_hash: str,
+    so_path: str,
+    max_fuel: int,
+    output_dir: str,
+    ptx_path: Optional[str] = None,
+    gpu_id: Optional[int] = None,
+    data_encrypted: Optional[str] = None,
+    hyperparameters: Optional[str] = None,
+    timeout: int = 0,
+    verbose: bool = False,
+    mem_high: float = 0.90,
+    mem_low: float = 0.75,
+    mem_interval: float = 0.05,
+    disable_oom: bool = False,
+    result_store: str = "files",
+    mem_trace: Optional[str] = None,
+    kill_budget: int = KILL_BUDGET,
+    kill_window: float = KILL_WINDOW,
+    pressure_action: str = "kill",
+    gpu_ids: Optional[List[int]] = None,
+    shared_sampler: bool = True,
+    arbiter: bool = True,
+    disable_profile: bool = False,
+    profile_path: Optional[str] = None,
+    nonce_trace: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    metrics_textfile: Optional[str] = None,
+    placement: str = "none",
+    disable_admission: bool = False,
+    cgroup_dir: Optional[str] = None,
+    autoscale: bool = False,
+    drain: str = "abandon",
+    drain_grace: float = 0.0,
+) -> int:
+    if timeout <= 0:
+        logger.error("timeout is required in explo mode")
+        return 0
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except PermissionError:
+        if not os.path.exists(output_dir):
+            logger.error(f"Cannot create output directory: {output_dir}")
+            return 0
+
+    try:
+        store = create_result_store(result_store, output_dir)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 0
+    store.discard_partials()
+    watchdog = create_watchdog(
+        gpu_id,
+        mem_high,
+        mem_low,
+        mem_interval,
+        disable_oom,
+        mem_trace,
+        kill_budget,
+        kill_window,
+        pressure_action,
+        gpu_ids,
+        shared_sampler,
+        arbiter,
+    )
+    watchdog.start()
+    profile = create_profile(
+        settings_json, so_path, watchdog, disable_profile, profile_path
+    )
+    max_workers = size_workers(profile, watchdog, max_workers, mem_high)
+    metrics = create_metrics(watchdog, "explo", metrics_port, metrics_textfile)
+    trace = create_nonce_trace(
+        nonce_trace,
+        metrics,
+        mode="explo",
+        settings=settings_json,
+        so_path=so_path,
+        max_fuel=max_fuel,
+        hyperparameters=hyperparameters,
+        start_nonce=start_nonce,
+        max_workers=max_workers,
+    )
+
+    admission = create_admission_controller(max_workers, disable_admission, cgroup_dir)
+    admission = create_autoscaler(
+        admission, watchdog, settings_json, so_path, "explo", autoscale, mem_high
+    )
+    admission.start()
+
+    start_time = time.time()
+    deadline = start_time + timeout
+    window_end = deadline + drain_grace
+    success_count = 0
+    current_nonce = start_nonce
+    resumed = {nonce for nonce in store.iter_computed() if nonce >= start_nonce}
+    retry_nonces = PendingQueue()
+    futures_map: Dict[Future, int] = {}
+    completions = CompletionQueue()
+    if metrics is not None:
+        metrics.track(
+            in_flight=lambda: len(futures_map), pending=lambda: len(retry_nonces)
+        )
+    watchdog.add_restart_listener(completions.notify)
+    admission.add_listener(completions.notify)
+
+    try:
+        with ProcessReaper(create_placement(placement)) as reaper:
+            while time.time() < deadline:
+                for nonce in watchdog.get_nonces_to_restart():
+                    retry_nonces.push(nonce, PRIORITY_RETRY)
+
+                while (
+                    admission.admit(len(futures_map)) and not watchdog.has_suspended()
+                ):
+                    if retry_nonces:
+                        nonce, priority = retry_nonces.pop()
+                    elif watchdog.get_pending_restart_count() == 0:
+                        while current_nonce in resumed:
+                            success_count += 1
                             current_nonce += 1
-                        new_future = executor.submit(
-                            process_single_nonce,
-                            next_nonce,
-                            settings_json,
-                            rand_hash,
-                            so_path,
-                            max_fuel,
-                            output_dir,
-                            ptx_path,
-                            gpu_id,
-                            data_encrypted,
-                            hyperparameters,
-                            timeout,
-                            verbose,
-                            False,
-                            watchdog,
-                        )
-                        futures_map[new_future] = next_nonce
-                        watchdog.register_task(next_nonce, new_future)
+                        nonce, priority = current_nonce, PRIORITY_FRESH
+                        current_nonce += 1
+                    else:
+                        break
+                    device = watchdog.pick_device(gpu_id)
+                    future, process = process_single_nonce(
+                        reaper,
+                        nonce,
+                        settings_json,
+                        rand_hash,
+                        so_path,
+                        max_fuel,
+                        store,
+                        ptx_path,
+                        device,
+                        data_encrypted,
+                        hyperparameters,
+                        timeout if drain == "wait" else 0,
+                        verbose,
+                        False,
+                        profile=profile,
+                        trace=trace,
+                    )
+                    futures_map[future] = nonce
+                    watchdog.register_task(
+                        nonce, future, process, priority, device=device
+                    )
+                    completions.watch(future)
+
+                for future in completions.wait(remaining_time(deadline)):
+                    success_count += collect_explo_result(
+                        future, futures_map, watchdog, admission, profile
+                    )
 
             if futures_map:
-                logger.info(
-                    f"Timeout reached, waiting for {len(futures_map)} remaining tasks to finish"
-                )
-                executor.shutdown(wait=True, cancel_futures=False)
+                if drain == "wait":
+                    logger.info(
+                        f"Timeout reached, waiting for {len(futures_map)} remaining tasks to finish"
+                    )
+                else:
+                    logger.info(
+                        f"Timeout reached, abandoning {len(futures_map)} remaining tasks after {drain_grace:.1f}s"
+                    )
+                    while futures_map and time.time() < window_end:
+                        for future in completions.wait(remaining_time(window_end)):
+                            success_count += collect_explo_result(
+                                future, futures_map, watchdog, admission, profile
+                            )
+                    if futures_map:
+                        logger.info(f"Abandoned {reaper.abandon()} unfinished tasks")
+            while futures_map:
+                for future in completions.wait():
+                    success_count += collect_explo_result(
+                        future, futures_map, watchdog, admission, profile
+                    )
+
+            unsubmitted = len(retry_nonces) + watchdog.get_pending_restart_count()
+            if unsubmitted:
+                logger.warning(f"{unsubmitted} OOM retries left unsubmitted at timeout")
 
     finally:
-        watchdog.stop()
+        stop_services(watchdog, admission, store, profile, trace, metrics)
 
     logger.info(
         f"Completed {success_count} nonces ({current_nonce - start_nonce} attempted in {time.time() - start_time:.1f}s)"
@@ -381,14 +856,18 @@ def main():
     parser.add_argument("--start-nonce", type=int, required=True)
     parser.add_argument("--num-nonces", type=int, required=True)
     parser.add_argument("--max-workers", type=int, required=True)
+    parser.add_argument("--verify-workers", type=int, default=0)
     parser.add_argument("--settings", required=True)
     parser.add_argument("--rand-hash", required=True)
     parser.add_argument("--so-path", required=True)
     parser.add_argument("--max-fuel", type=int, required=True)
     parser.add_argument("--output-dir", required=True)
-    parser.add_argument("--mode", required=True, choices=["runtime", "bench", "explo", "explo_time"])
+    parser.add_argument("--mode", required=True, choices=["runtime", "runtime+verify", "bench", "explo", "explo_time"])
     parser.add_argument("--ptx", default=None)
     parser.add_argument("--gpu-id", type=int, default=None)
+    parser.add_argument("--gpu-ids", default=None)
+    parser.add_argument("--no-shared-sampler", action="store_true")
+    parser.add_argument("--no-arbiter", action="store_true")
     parser.add_argument("--data", default=None)
     parser.add_argument("--hyperparameters", default=None)
     parser.add_argument("--timeout", type=int, default=0)
@@ -397,11 +876,35 @@ def main():
     parser.add_argument("--mem-low", type=float, default=75.0)
     parser.add_argument("--mem-interval", type=int, default=10)
     parser.add_argument("--no-oom", action="store_true")
+    parser.add_argument("--result-store", default="files", choices=RESULT_STORES)
+    parser.add_argument("--quality-index", action="store_true")
+    parser.add_argument("--mem-trace", default=None)
+    parser.add_argument("--kill-budget", type=int, default=KILL_BUDGET)
+    parser.add_argument("--kill-window", type=float, default=KILL_WINDOW)
+    parser.add_argument("--pressure-action", default="kill", choices=PRESSURE_ACTIONS)
+    parser.add_argument("--no-profile", action="store_true")
+    parser.add_argument("--profile-path", default=None)
+    parser.add_argument("--no-admission", action="store_true")
+    parser.add_argument("--cgroup-dir", default=None)
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--shard-count", type=int, default=1)
+    parser.add_argument("--nonce-order", default="sequential", choices=NONCE_ORDERS)
+    parser.add_argument("--nonce-trace", default=None)
+    parser.add_argument("--metrics-port", type=int, default=None)
+    parser.add_argument("--metrics-textfile", default=None)
+    parser.add_argument("--autoscale", action="store_true")
+    parser.add_argument("--placement", default="none", choices=PLACEMENTS)
+    parser.add_argument("--drain", default="abandon", choices=EXPLO_DRAINS)
+    parser.add_argument("--drain-grace", type=float, default=0.0)
 
     args = parser.parse_args()
 
+    logging.basicConfig(
+        level=logging.INFO, format="[batch_processor] %(message)s", stream=sys.stdout
+    )
     if args.verbose:
         logger.setLevel(logging.DEBUG)
+        verifier_logger.setLevel(logging.DEBUG)
 
     mem_high = args.mem_high / 100.0
     mem_low = args.mem_low / 100.0
@@ -411,50 +914,159 @@ def main():
         logger.error("mem-low must be less than mem-high")
         sys.exit(1)
 
+    if args.drain_grace < 0:
+        logger.error("drain-grace must not be negative")
+        sys.exit(1)
+
+    gpu_id = args.gpu_id
+    gpu_ids = [int(i) for i in args.gpu_ids.split(",")] if args.gpu_ids else None
+    if gpu_ids and gpu_id is None:
+        gpu_id = gpu_ids[0]
+
+    try:
+        start_nonce, num_nonces = shard_range(
+            args.start_nonce, args.num_nonces, args.shard_index, args.shard_count
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    if args.shard_count > 1 and args.mode == "explo":
+        logger.error("explo mode does not support --shard-count > 1")
+        sys.exit(1)
+    shard = f"{start_nonce}-{num_nonces}" if args.shard_count > 1 else None
+    if args.shard_count > 1:
+        logger.info(
+            f"Shard {args.shard_index}/{args.shard_count}: nonces {start_nonce}..{start_nonce + num_nonces - 1}"
+        )
+
     if args.mode == "explo":
         success_count = process_explo_batch(
-            args.start_nonce,
-            args.max_workers,
-            args.settings,
-            args.rand_hash,
-            args.so_path,
-            args.max_fuel,
-            args.output_dir,
-            args.ptx,
-            args.gpu_id,
-            args.data,
-            args.hyperparameters,
-            args.timeout,
-            args.verbose,
-            mem_high,
-            mem_low,
-            mem_interval,
-            args.no_oom,
+            start_nonce=args.start_nonce,
+            max_workers=args.max_workers,
+            settings_json=args.settings,
+            rand_hash=args.rand_hash,
+            so_path=args.so_path,
+            max_fuel=args.max_fuel,
+            output_dir=args.output_dir,
+            ptx_path=args.ptx,
+            gpu_id=gpu_id,
+            data_encrypted=args.data,
+            hyperparameters=args.hyperparameters,
+            timeout=args.timeout,
+            verbose=args.verbose,
+            mem_high=mem_high,
+            mem_low=mem_low,
+            mem_interval=mem_interval,
+            disable_oom=args.no_oom,
+            result_store=args.result_store,
+            mem_trace=args.mem_trace,
+            kill_budget=args.kill_budget,
+            kill_window=args.kill_window,
+            pressure_action=args.pressure_action,
+            gpu_ids=gpu_ids,
+            shared_sampler=not args.no_shared_sampler,
+            arbiter=not args.no_arbiter,
+            disable_profile=args.no_profile,
+            profile_path=args.profile_path,
+            nonce_trace=args.nonce_trace,
+            metrics_port=args.metrics_port,
+            metrics_textfile=args.metrics_textfile,
+            placement=args.placement,
+            disable_admission=args.no_admission,
+            cgroup_dir=args.cgroup_dir,
+            autoscale=args.autoscale,
+            drain=args.drain,
+            drain_grace=args.drain_grace,
         )
         sys.exit(0 if success_count > 0 else 1)
+    elif args.mode == "runtime+verify":
+        success_count = process_pipeline_batch(
+            start_nonce=start_nonce,
+            num_nonces=num_nonces,
+            max_workers=args.max_workers,
+            verify_workers=(
+                args.verify_workers if args.verify_workers > 0 else args.max_workers
+            ),
+            settings_json=args.settings,
+            rand_hash=args.rand_hash,
+            so_path=args.so_path,
+            max_fuel=args.max_fuel,
+            output_dir=args.output_dir,
+            ptx_path=args.ptx,
+            gpu_id=gpu_id,
+            data_encrypted=args.data,
+            hyperparameters=args.hyperparameters,
+            timeout=args.timeout,
+            verbose=args.verbose,
+            stop_on_error=True,
+            mem_high=mem_high,
+            mem_low=mem_low,
+            mem_interval=mem_interval,
+            disable_oom=args.no_oom,
+            result_store=args.result_store,
+            quality_index=args.quality_index,
+            mem_trace=args.mem_trace,
+            kill_budget=args.kill_budget,
+            kill_window=args.kill_window,
+            pressure_action=args.pressure_action,
+            gpu_ids=gpu_ids,
+            shared_sampler=not args.no_shared_sampler,
+            arbiter=not args.no_arbiter,
+            disable_profile=args.no_profile,
+            profile_path=args.profile_path,
+            disable_admission=args.no_admission,
+            cgroup_dir=args.cgroup_dir,
+            nonce_order=args.nonce_order,
+            nonce_trace=args.nonce_trace,
+            metrics_port=args.metrics_port,
+            metrics_textfile=args.metrics_textfile,
+            autoscale=args.autoscale,
+            placement=args.placement,
+            shard=shard,
+        )
+        sys.exit(0 if success_count == num_nonces else 1)
     else:
         success_count = process_runtime_batch(
-            args.start_nonce,
-            args.num_nonces,
-            args.max_workers,
-            args.settings,
-            args.rand_hash,
-            args.so_path,
-            args.max_fuel,
-            args.output_dir,
-            args.ptx,
-            args.gpu_id,
-            args.data,
-            args.hyperparameters,
-            args.timeout,
-            args.verbose,
-            args.mode == "runtime",
-            mem_high,
-            mem_low,
-            mem_interval,
-            args.no_oom,
+            start_nonce=start_nonce,
+            num_nonces=num_nonces,
+            max_workers=args.max_workers,
+            settings_json=args.settings,
+            rand_hash=args.rand_hash,
+            so_path=args.so_path,
+            max_fuel=args.max_fuel,
+            output_dir=args.output_dir,
+            ptx_path=args.ptx,
+            gpu_id=gpu_id,
+            data_encrypted=args.data,
+            hyperparameters=args.hyperparameters,
+            timeout=args.timeout,
+            verbose=args.verbose,
+            stop_on_error=args.mode == "runtime",
+            mem_high=mem_high,
+            mem_low=mem_low,
+            mem_interval=mem_interval,
+            disable_oom=args.no_oom,
+            result_store=args.result_store,
+            mem_trace=args.mem_trace,
+            kill_budget=args.kill_budget,
+            kill_window=args.kill_window,
+            pressure_action=args.pressure_action,
+            gpu_ids=gpu_ids,
+            shared_sampler=not args.no_shared_sampler,
+            arbiter=not args.no_arbiter,
+            disable_profile=args.no_profile,
+            profile_path=args.profile_path,
+            disable_admission=args.no_admission,
+            cgroup_dir=args.cgroup_dir,
+            nonce_order=args.nonce_order,
+            nonce_trace=args.nonce_trace,
+            metrics_port=args.metrics_port,
+            metrics_textfile=args.metrics_textfile,
+            autoscale=args.autoscale,
+            placement=args.placement,
+            shard=shard,
         )
-        sys.exit(0 if success_count == args.num_nonces else 1)
+        sys.exit(0 if success_count == num_nonces else 1)
 
 
 if __name__ == "__main__":
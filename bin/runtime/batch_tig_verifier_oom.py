@@ -1,94 +1,128 @@
 import argparse
-import json
 import logging
 import os
 import subprocess
 import sys
-import time
-from concurrent.futures import ThreadPoolExecutor, Future, wait, ALL_COMPLETED
-from typing import Dict, Optional, Set
-
-from watchdog_oom import create_watchdog, BaseWatchdog
-
-logging.basicConfig(
-    level=logging.INFO, format="[batch_verifier] %(message)s", stream=sys.stdout
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set
+
+from scheduler_oom import (
+    PRIORITY_RETRY,
+    PRIORITY_VERIFY,
+    ChildExit,
+    CompletionQueue,
+    PendingQueue,
+    ProcessReaper,
+    has_oom_message,
+    resolved_future,
+)
+from result_store_oom import (
+    RESULT_STORES,
+    QualityIndex,
+    ResultStore,
+    bitmap_test,
+    create_result_store,
+    write_json_atomic,
 )
+from admission_oom import create_admission_controller
+from autoscale_oom import create_autoscaler
+from kill_policy_oom import KILL_BUDGET, KILL_WINDOW, PRESSURE_ACTIONS
+from metrics_oom import create_metrics
+from nonce_order_oom import NONCE_ORDERS, create_nonce_order, shard_range
+from nonce_trace_oom import NonceTrace, create_nonce_trace
+from placement_oom import PLACEMENTS, create_placement
+from services_oom import stop_services
+from watchdog_oom import create_watchdog
+
 logger = logging.getLogger(__name__)
 
+VERIFIER_BIN = os.environ.get("TIG_POOL_VERIFIER_BIN", "tig-pool-verifier")
+
 
 def verify_nonce(
+    reaper: ProcessReaper,
     nonce: int,
     settings_json: str,
     rand_hash: str,
-    output_dir: str,
+    store: ResultStore,
     ptx_path: Optional[str] = None,
     gpu_id: Optional[int] = None,
     data_encrypted: Optional[str] = None,
     verbose: bool = False,
-    watchdog: Optional[BaseWatchdog] = None,
-) -> tuple[int, Optional[str]]:
-    output_file = f"{output_dir}/{nonce}.json"
-    if not os.path.exists(output_file):
-        return (nonce, "missing file")
-
-    try:
-        verify_cmd = [
-            "tig-pool-verifier",
-            settings_json,
-            rand_hash,
-            str(nonce),
-            output_file,
-        ]
-        if data_encrypted:
-            verify_cmd += ["--data", data_encrypted]
-        if ptx_path:
-            verify_cmd += ["--ptx", ptx_path]
-        if gpu_id is not None:
-            verify_cmd += ["--gpu", str(gpu_id)]
-
-        process = subprocess.Popen(
-            verify_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        if watchdog:
-            watchdog.set_process(nonce, process)
+    qualities: Optional[QualityIndex] = None,
+    trace: Optional[NonceTrace] = None,
+) -> tuple[Future, Optional[subprocess.Popen]]:
+    output_file = store.solution_path(nonce)
+
+    verify_cmd = [
+        VERIFIER_BIN,
+        settings_json,
+        rand_hash,
+        str(nonce),
+        output_file,
+    ]
+    if data_encrypted:
+        verify_cmd += ["--data", data_encrypted]
+    if ptx_path:
+        verify_cmd += ["--ptx", ptx_path]
+    if gpu_id is not None:
+        verify_cmd += ["--gpu", str(gpu_id)]
+
+    def on_error(e: Exception) -> tuple[int, Optional[str]]:
+        store.release_solution_path(nonce, output_file)
+        print(f"nonce {nonce}: {e}", file=sys.stderr)
+        return (nonce, str(e))
 
+    def on_exit(child: ChildExit) -> tuple[int, Optional[str]]:
+        store.release_solution_path(nonce, output_file)
         try:
-            stdout, stderr = process.communicate(timeout=60)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.communicate()
-            raise
+            if child.abandoned:
+                return (nonce, "abandoned")
+
+            if child.timed_out:
+                raise subprocess.TimeoutExpired(VERIFIER_BIN, 60)
+
+            if child.aborted:
+                return (nonce, "cuda_oom")
 
-        if process.returncode in (-15, -9):
-            return (nonce, "killed_by_oom")
+            if child.returncode in (-15, -9):
+                return (nonce, "killed_by_oom")
 
-        stderr_str = stderr.decode(errors="ignore").strip()
-        if "OUT_OF_MEMORY" in stderr_str or "out of memory" in stderr_str.lower():
-            return (nonce, "cuda_oom")
+            if has_oom_message(child.stderr):
+                return (nonce, "cuda_oom")
 
-        if process.returncode != 0:
-            raise Exception(f"exit {process.returncode}: {stderr_str}")
+            if child.returncode != 0:
+                stderr_str = child.stderr.decode(errors="ignore").strip()
+                raise Exception(f"exit {child.returncode}: {stderr_str}")
 
-        stdout_str = stdout.decode(errors="ignore").strip()
-        last_line = stdout_str.splitlines()[-1] if stdout_str else ""
-        if not last_line.startswith("quality: "):
-            raise Exception("failed to find quality in output")
+            stdout_str = child.stdout.decode(errors="ignore").strip()
+            last_line = stdout_str.splitlines()[-1] if stdout_str else ""
+            if not last_line.startswith("quality: "):
+                raise Exception("failed to find quality in output")
 
-        quality = int(last_line[len("quality: ") :])
-        if verbose:
-            logger.debug(f"nonce {nonce}: quality {quality}")
+            quality = int(last_line[len("quality: ") :])
+            if verbose:
+                logger.debug(f"nonce {nonce}: quality {quality}")
 
-        with open(output_file, "r") as f:
-            d = json.load(f)
-            d["quality"] = quality
-        with open(output_file, "w") as f:
-            json.dump(d, f)
+            if qualities is not None:
+                qualities.set(nonce, quality)
+                store.commit(nonce)
+            else:
+                store.commit(nonce, quality)
+            return (nonce, None)
 
-        return (nonce, None)
+        except Exception as e:
+            return on_error(e)
 
+    try:
+        return reaper.spawn(
+            verify_cmd,
+            on_exit if trace is None else trace.wrap(nonce, "verify", on_exit),
+            60,
+            has_oom_message,
+        )
     except Exception as e:
-        print(f"nonce {nonce}: {e}", file=sys.stderr)
-        return (nonce, str(e))
+        return resolved_future(on_error, e), None
 
 
 def verify_batch(
@@ -106,6 +140,24 @@ def verify_batch(
     mem_low: float = 0.75,
     mem_interval: float = 0.05,
     disable_oom: bool = False,
+    result_store: str = "files",
+    quality_index: bool = False,
+    mem_trace: Optional[str] = None,
+    kill_budget: int = KILL_BUDGET,
+    kill_window: float = KILL_WINDOW,
+    pressure_action: str = "kill",
+    gpu_ids: Optional[List[int]] = None,
+    shared_sampler: bool = True,
+    arbiter: bool = True,
+    disable_admission: bool = False,
+    cgroup_dir: Optional[str] = None,
+    nonce_order: str = "sequential",
+    nonce_trace: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    metrics_textfile: Optional[str] = None,
+    autoscale: bool = False,
+    placement: str = "none",
+    shard: Optional[str] = None,
 ) -> bool:
     try:
         os.makedirs(output_dir, exist_ok=True)
@@ -114,55 +166,114 @@ def verify_batch(
             logger.error(f"Cannot create output directory: {output_dir}")
             return False
 
-    watchdog = create_watchdog(gpu_id, mem_high, mem_low, mem_interval, disable_oom)
+    try:
+        store = create_result_store(result_store, output_dir, shard)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return False
+    qualities = (
+        QualityIndex(output_dir, start_nonce, num_nonces, shard)
+        if quality_index
+        else None
+    )
+    watchdog = create_watchdog(
+        gpu_id,
+        mem_high,
+        mem_low,
+        mem_interval,
+        disable_oom,
+        mem_trace,
+        kill_budget,
+        kill_window,
+        pressure_action,
+        gpu_ids,
+        shared_sampler,
+        arbiter,
+    )
     watchdog.start()
+    metrics = create_metrics(watchdog, "verify", metrics_port, metrics_textfile)
+    trace = create_nonce_trace(
+        nonce_trace,
+        metrics,
+        mode="verify",
+        settings=settings_json,
+        start_nonce=start_nonce,
+        max_workers=max_workers,
+    )
+    admission = create_admission_controller(max_workers, disable_admission, cgroup_dir)
+    admission = create_autoscaler(
+        admission,
+        watchdog,
+        settings_json,
+        VERIFIER_BIN,
+        "verify",
+        autoscale,
+        mem_high,
+    )
+    admission.start()
 
     success_count = 0
     errors = {}
-    pending_nonces = set(range(start_nonce, start_nonce + num_nonces))
+    pending_nonces = PendingQueue()
     completed_nonces: Set[int] = set()
+    computed = store.scan_computed(start_nonce, num_nonces)
+    for nonce in create_nonce_order(nonce_order, start_nonce, num_nonces):
+        if bitmap_test(computed, nonce - start_nonce):
+            pending_nonces.push(nonce, PRIORITY_VERIFY)
+        else:
+            errors[nonce] = "missing file"
+            completed_nonces.add(nonce)
     futures_map: Dict[Future, int] = {}
+    completions = CompletionQueue()
+    if metrics is not None:
+        metrics.track(
+            in_flight=lambda: len(futures_map), pending=lambda: len(pending_nonces)
+        )
+    watchdog.add_restart_listener(completions.notify)
+    admission.add_listener(completions.notify)
 
     try:
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with ProcessReaper(create_placement(placement)) as reaper:
             while (
                 pending_nonces
                 or futures_map
                 or watchdog.get_pending_restart_count() > 0
             ):
-                for nonce in watchdog.get_nonces_to_restart():
-                    if nonce not in completed_nonces:
-                        pending_nonces.add(nonce)
-
-                while pending_nonces and len(futures_map) < max_workers:
-                    nonce = pending_nonces.pop()
-                    future = executor.submit(
-                        verify_nonce,
+                if watchdog.get_pending_restart_count() > 0:
+                    for nonce in watchdog.get_nonces_to_restart():
+                        if nonce not in completed_nonces:
+                            pending_nonces.push(nonce, PRIORITY_VERIFY + PRIORITY_RETRY)
+
+                while (
+                    pending_nonces
+                    and admission.admit(len(futures_map))
+                    and not watchdog.has_suspended()
+                ):
+                    nonce, priority = pending_nonces.pop()
+                    device = watchdog.pick_device(gpu_id)
+                    future, process = verify_nonce(
+                        reaper,
                         nonce,
                         settings_json,
                         rand_hash,
-                        output_dir,
+                        store,
                         ptx_path,
-                        gpu_id,
+                        device,
                         data_encrypted,
                         verbose,
-                        watchdog,
+                        qualities,
+                        trace,
                     )
                     futures_map[future] = nonce
-                    watchdog.register_task(nonce, future)
+                    watchdog.register_task(
+                        nonce, future, process, priority, device=device, kind="verify"
+                    )
+                    completions.watch(future)
 
-                if not futures_map:
-                    if watchdog.get_pending_restart_count() > 0:
-                        time.sleep(mem_interval * 2)
-                        continue
+                if not futures_map and watchdog.get_pending_restart_count() == 0:
                     break
 
-                wait_timeout = max(mem_interval * 5, 0.05)
-                done, _ = wait(
-                    futures_map.keys(), timeout=wait_timeout, return_when=ALL_COMPLETED
-                )
-
-                for future in done:
+                for future in completions.wait():
                     nonce = futures_map.pop(future)
                     watchdog.unregister_task(nonce)
                     if future.cancelled():
@@ -172,6 +283,7 @@ def verify_batch(
                         if error_msg is None:
                             success_count += 1
                             completed_nonces.add(result_nonce)
+                            admission.completed()
                         elif error_msg in ("killed_by_oom", "cuda_oom"):
                             watchdog.queue_for_retry(result_nonce)
                         else:
@@ -182,15 +294,10 @@ def verify_batch(
                         completed_nonces.add(nonce)
 
     finally:
-        if futures_map:
-            logger.info(f"Cancelling {len(futures_map)} remaining tasks")
-            for future in futures_map:
-                future.cancel()
-        watchdog.stop()
+        stop_services(watchdog, admission, store, None, trace, metrics, qualities)
 
     if errors:
-        with open(f"{output_dir}/verifier_errors.json", "w") as f:
-            json.dump({"errors": errors}, f)
+        write_json_atomic(store.report_path("verifier_errors"), {"errors": errors})
 
     logger.info(f"Completed {success_count}/{num_nonces} nonces")
     return success_count == num_nonces
@@ -209,14 +316,36 @@ def main():
     parser.add_argument("--data", default=None)
     parser.add_argument("--ptx", default=None)
     parser.add_argument("--gpu-id", type=int, default=None)
+    parser.add_argument("--gpu-ids", default=None)
+    parser.add_argument("--no-shared-sampler", action="store_true")
+    parser.add_argument("--no-arbiter", action="store_true")
     parser.add_argument("--verbose", action="store_true")
     parser.add_argument("--mem-high", type=float, default=90.0)
     parser.add_argument("--mem-low", type=float, default=75.0)
     parser.add_argument("--mem-interval", type=int, default=10)
     parser.add_argument("--no-oom", action="store_true")
+    parser.add_argument("--result-store", default="files", choices=RESULT_STORES)
+    parser.add_argument("--quality-index", action="store_true")
+    parser.add_argument("--mem-trace", default=None)
+    parser.add_argument("--kill-budget", type=int, default=KILL_BUDGET)
+    parser.add_argument("--kill-window", type=float, default=KILL_WINDOW)
+    parser.add_argument("--pressure-action", default="kill", choices=PRESSURE_ACTIONS)
+    parser.add_argument("--no-admission", action="store_true")
+    parser.add_argument("--cgroup-dir", default=None)
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--shard-count", type=int, default=1)
+    parser.add_argument("--nonce-order", default="sequential", choices=NONCE_ORDERS)
+    parser.add_argument("--nonce-trace", default=None)
+    parser.add_argument("--metrics-port", type=int, default=None)
+    parser.add_argument("--metrics-textfile", default=None)
+    parser.add_argument("--autoscale", action="store_true")
+    parser.add_argument("--placement", default="none", choices=PLACEMENTS)
 
     args = parser.parse_args()
 
+    logging.basicConfig(
+        level=logging.INFO, format="[batch_verifier] %(message)s", stream=sys.stdout
+    )
     if args.verbose:
         logger.setLevel(logging.DEBUG)
 
@@ -228,21 +357,57 @@ def main():
         logger.error("mem-low must be less than mem-high")
         sys.exit(1)
 
+    gpu_id = args.gpu_id
+    gpu_ids = [int(i) for i in args.gpu_ids.split(",")] if args.gpu_ids else None
+    if gpu_ids and gpu_id is None:
+        gpu_id = gpu_ids[0]
+
+    try:
+        start_nonce, num_nonces = shard_range(
+            args.start_nonce, args.num_nonces, args.shard_index, args.shard_count
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    shard = f"{start_nonce}-{num_nonces}" if args.shard_count > 1 else None
+    if args.shard_count > 1:
+        logger.info(
+            f"Shard {args.shard_index}/{args.shard_count}: nonces {start_nonce}..{start_nonce + num_nonces - 1}"
+        )
+
     success = verify_batch(
-        args.start_nonce,
-        args.num_nonces,
-        args.max_workers,
-        args.settings,
-        args.rand_hash,
-        args.output_dir,
-        args.data,
-        args.ptx,
-        args.gpu_id,
-        args.verbose,
-        mem_high,
-        mem_low,
-        mem_interval,
-        args.no_oom,
+        start_nonce=start_nonce,
+        num_nonces=num_nonces,
+        max_workers=args.max_workers,
+        settings_json=args.settings,
+        rand_hash=args.rand_hash,
+        output_dir=args.output_dir,
+        data_encrypted=args.data,
+        ptx_path=args.ptx,
+        gpu_id=gpu_id,
+        verbose=args.verbose,
+        mem_high=mem_high,
+        mem_low=mem_low,
+        mem_interval=mem_interval,
+        disable_oom=args.no_oom,
+        result_store=args.result_store,
+        quality_index=args.quality_index,
+        mem_trace=args.mem_trace,
+        kill_budget=args.kill_budget,
+        kill_window=args.kill_window,
+        pressure_action=args.pressure_action,
+        gpu_ids=gpu_ids,
+        shared_sampler=not args.no_shared_sampler,
+        arbiter=not args.no_arbiter,
+        disable_admission=args.no_admission,
+        cgroup_dir=args.cgroup_dir,
+        nonce_order=args.nonce_order,
+        nonce_trace=args.nonce_trace,
+        metrics_port=args.metrics_port,
+        metrics_textfile=args.metrics_textfile,
+        autoscale=args.autoscale,
+        placement=args.placement,
+        shard=shard,
     )
 
     sys.exit(0 if success else 1)
@@ -0,0 +1,48 @@
+import argparse
+import json
+
+from bench_pressure_policy_oom import run_driver
+from placement_oom import PLACEMENTS
+from result_store_oom import RESULT_STORES
+
+
+def run_placement(
+    placement: str, output_dir: str, result_store: str, driver_args: list
+) -> dict:
+    result = run_driver(
+        placement, output_dir, result_store, [*driver_args, "--placement", placement]
+    )
+    return {"placement": placement, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare worker CPU placements against the unpinned baseline",
+        usage="%(prog)s --output-dir DIR [--placement P ...] -- DRIVER_ARGS...",
+    )
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--placement", choices=PLACEMENTS, action="append")
+    parser.add_argument("--result-store", default="files", choices=RESULT_STORES)
+    parser.add_argument("driver_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    driver_args = args.driver_args
+    if driver_args and driver_args[0] == "--":
+        driver_args = driver_args[1:]
+    placements = args.placement or list(PLACEMENTS)
+    if "none" not in placements:
+        placements.insert(0, "none")
+    baseline = None
+    for placement in placements:
+        result = run_placement(
+            placement, args.output_dir, args.result_store, driver_args
+        )
+        if placement == "none":
+            baseline = result["nonces_per_hour"]
+        elif baseline:
+            result["speedup"] = round(result["nonces_per_hour"] / baseline, 3)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from kill_policy_oom import PRESSURE_ACTIONS
+from result_store_oom import RESULT_STORES, create_result_store
+
+DRIVER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "batch_tig_runtime_oom.py"
+)
+
+
+def count_events(trace_path: str) -> Counter:
+    events: Counter = Counter()
+    try:
+        with open(trace_path, "r") as f:
+            for line in f:
+                try:
+                    event = json.loads(line).get("event")
+                except json.JSONDecodeError:
+                    break
+                if event:
+                    events[event] += 1
+    except OSError:
+        pass
+    return events
+
+
+def run_driver(
+    name: str, output_dir: str, result_store: str, driver_args: list
+) -> dict:
+    run_dir = f"{output_dir}/{name}"
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    trace_path = f"{run_dir}/trace.jsonl"
+    cmd = [
+        sys.executable,
+        DRIVER,
+        *driver_args,
+        "--output-dir",
+        run_dir,
+        "--result-store",
+        result_store,
+        "--mem-trace",
+        trace_path,
+    ]
+    start = time.time()
+    returncode = subprocess.call(cmd, stdout=subprocess.DEVNULL)
+    elapsed = time.time() - start
+    store = create_result_store(result_store, run_dir)
+    try:
+        completed = sum(1 for _ in store.iter_computed())
+    finally:
+        store.close()
+    events = count_events(trace_path)
+    return {
+        "returncode": returncode,
+        "completed": completed,
+        "seconds": round(elapsed, 1),
+        "nonces_per_hour": round(completed * 3600 / elapsed, 1) if elapsed else 0,
+        "kills": events["kill"],
+        "suspends": events["suspend"],
+    }
+
+
+def run_policy(
+    policy: str, output_dir: str, result_store: str, driver_args: list
+) -> dict:
+    result = run_driver(
+        policy, output_dir, result_store, [*driver_args, "--pressure-action", policy]
+    )
+    return {"policy": policy, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare memory pressure policies on the same batch",
+        usage="%(prog)s --output-dir DIR [--policy P ...] -- DRIVER_ARGS...",
+    )
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--policy", choices=PRESSURE_ACTIONS, action="append")
+    parser.add_argument("--result-store", default="files", choices=RESULT_STORES)
+    parser.add_argument("driver_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    driver_args = args.driver_args
+    if driver_args and driver_args[0] == "--":
+        driver_args = driver_args[1:]
+    for policy in args.policy or list(PRESSURE_ACTIONS):
+        result = run_policy(policy, args.output_dir, args.result_store, driver_args)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILES = ("batch_tig_runtime_oom.py", "watchdog_oom.py")
+STUB_RUNTIME = """#!{executable} -S
+import json, os, resource, sys, time
+args = sys.argv[1:]
+nonce = int(args[2])
+output = args[args.index("--output") + 1]
+time.sleep({sleep})
+with open(os.path.join(output, f"{{nonce}}.json"), "w") as f:
+    json.dump({{"nonce": nonce, "solution": {{}}}}, f)
+usage = resource.getrusage(resource.RUSAGE_SELF)
+with open({log!r}, "a") as f:
+    f.write(f"{{usage.ru_utime + usage.ru_stime}}\\n")
+"""
+SPAWN_HOOK = """import os, subprocess, time
+LOG = os.environ.get("TIG_BENCH_SPAWN_LOG")
+if LOG:
+    popen_init = subprocess.Popen.__init__
+    handle_exitstatus = subprocess.Popen._handle_exitstatus
+
+    def __init__(self, args, *rest, **kwargs):
+        if os.path.basename(str(args[0])) == "tig-pool-runtime":
+            self._bench_spawned_at = time.time()
+        popen_init(self, args, *rest, **kwargs)
+
+    def _handle_exitstatus(self, *args, **kwargs):
+        handle_exitstatus(self, *args, **kwargs)
+        spawned_at = getattr(self, "_bench_spawned_at", None)
+        if spawned_at is not None:
+            with open(LOG, "a") as f:
+                f.write(f"{spawned_at} {time.time()}\\n")
+
+    subprocess.Popen.__init__ = __init__
+    subprocess.Popen._handle_exitstatus = _handle_exitstatus
+"""
+
+
+def write_stub(stub_dir: str, sleep_ms: float, log_path: str) -> str:
+    os.makedirs(stub_dir, exist_ok=True)
+    path = os.path.join(stub_dir, "tig-pool-runtime")
+    with open(path, "w") as f:
+        f.write(
+            STUB_RUNTIME.format(
+                executable=sys.executable, sleep=sleep_ms / 1000.0, log=log_path
+            )
+        )
+    os.chmod(path, 0o755)
+    return path
+
+
+def write_spawn_hook(hook_dir: str) -> str:
+    os.makedirs(hook_dir, exist_ok=True)
+    with open(os.path.join(hook_dir, "sitecustomize.py"), "w") as f:
+        f.write(SPAWN_HOOK)
+    return hook_dir
+
+
+def extract_baseline(target_dir: str, rev: Optional[str]) -> str:
+    if rev is None:
+        rev = subprocess.check_output(
+            ["git", "-C", HERE, "rev-list", "--max-parents=0", "HEAD"], text=True
+        ).split()[0]
+    os.makedirs(target_dir, exist_ok=True)
+    for name in BASELINE_FILES:
+        source = subprocess.check_output(["git", "-C", HERE, "show", f"{rev}:./{name}"])
+        with open(os.path.join(target_dir, name), "wb") as f:
+            f.write(source)
+    return os.path.join(target_dir, BASELINE_FILES[0])
+
+
+def supports_nonce_trace(driver: str) -> bool:
+    with open(driver, "r") as f:
+        return "--nonce-trace" in f.read()
+
+
+def read_stub_cpu(log_path: str) -> tuple[int, float]:
+    try:
+        with open(log_path, "r") as f:
+            seconds = [float(line) for line in f if line.strip()]
+    except OSError:
+        return 0, 0.0
+    return len(seconds), sum(seconds)
+
+
+def read_spawn_log(log_path: str) -> tuple[list, list]:
+    spawns, exits = [], []
+    try:
+        with open(log_path, "r") as f:
+            for line in f:
+                spawned_at, exited_at = (float(x) for x in line.split())
+                spawns.append(spawned_at)
+                exits.append(exited_at)
+    except OSError:
+        pass
+    return sorted(spawns), sorted(exits)
+
+
+def read_trace(trace_path: str) -> tuple[list, list]:
+    spawns, exits = [], []
+    try:
+        with open(trace_path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("stage") == "runtime":
+                    spawns.append(record["t"] - record["wall"])
+                    exits.append(record["t"])
+    except OSError:
+        pass
+    return sorted(spawns), sorted(exits)
+
+
+def idle_slot_latency(spawns: list, exits: list, max_workers: int) -> list:
+    return [max(spawn - exits[i], 0.0) for i, spawn in enumerate(spawns[max_workers:])]
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def run_driver(
+    name: str,
+    driver: Optional[str],
+    output_dir: str,
+    num_nonces: int,
+    max_workers: int,
+    sleep_ms: float,
+    baseline_rev: Optional[str] = None,
+) -> dict:
+    run_dir = f"{output_dir}/{name}"
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(f"{run_dir}/out")
+    log_path = f"{run_dir}/stub.log"
+    stub = write_stub(f"{run_dir}/bin", sleep_ms, log_path)
+    if driver is None:
+        driver = extract_baseline(f"{run_dir}/driver", baseline_rev)
+    env = dict(
+        os.environ,
+        PATH=f"{os.path.dirname(stub)}{os.pathsep}{os.environ.get('PATH', '')}",
+        PYTHONPATH=write_spawn_hook(f"{run_dir}/hook"),
+        TIG_POOL_RUNTIME_BIN=stub,
+        TIG_POOL_ARBITER_DIR=f"{run_dir}/arbiter",
+        TIG_POOL_PROFILE_PATH=f"{run_dir}/profiles.json",
+    )
+    cmd = [
+        sys.executable,
+        driver,
+        "--start-nonce",
+        "0",
+        "--num-nonces",
+        str(num_nonces),
+        "--max-workers",
+        str(max_workers),
+        "--settings",
+        "{}",
+        "--rand-hash",
+        "bench",
+        "--so-path",
+        "bench.so",
+        "--max-fuel",
+        "1",
+        "--output-dir",
+        f"{run_dir}/out",
+        "--mode",
+        "runtime",
+        "--timeout",
+        "0",
+    ]
+    trace_path = f"{run_dir}/trace.jsonl"
+    spawn_log = f"{run_dir}/spawns.log"
+    traced = supports_nonce_trace(driver)
+    if traced:
+        cmd += ["--nonce-trace", trace_path]
+    else:
+        env["TIG_BENCH_SPAWN_LOG"] = spawn_log
+    start = time.time()
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.time() - start
+    completed, stub_cpu = read_stub_cpu(log_path)
+    spawns, exits = read_trace(trace_path) if traced else read_spawn_log(spawn_log)
+    driver_cpu = rusage.ru_utime + rusage.ru_stime - stub_cpu
+    latency = idle_slot_latency(spawns, exits, max_workers)
+    return {
+        "driver": name,
+        "returncode": os.waitstatus_to_exitcode(status),
+        "completed": completed,
+        "timestamps": "nonce-trace" if traced else "popen-hook",
+        "seconds": round(elapsed, 3),
+        "ideal_seconds": round(-(-num_nonces // max_workers) * sleep_ms / 1000.0, 3),
+        "idle_slot_ms_p50": round(percentile(latency, 0.50) * 1000, 2),
+        "idle_slot_ms_p99": round(percentile(latency, 0.99) * 1000, 2),
+        "driver_cpu_seconds": round(max(driver_cpu, 0.0), 3),
+        "driver_cpu_ms_per_nonce": round(
+            max(driver_cpu, 0.0) * 1000 / max(completed, 1), 3
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure idle-slot latency and driver CPU with a sleeping stub runtime"
+    )
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--driver", action="append", metavar="NAME=PATH")
+    parser.add_argument("--num-nonces", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--sleep-ms", type=float, default=20.0)
+    parser.add_argument("--baseline-rev", default=None)
+    args = parser.parse_args()
+
+    drivers = {"baseline": None, "current": os.path.join(HERE, BASELINE_FILES[0])}
+    if args.driver:
+        drivers = dict(d.split("=", 1) for d in args.driver)
+    for name, driver in drivers.items():
+        result = run_driver(
+            name,
+            driver,
+            args.output_dir,
+            args.num_nonces,
+            args.max_workers,
+            args.sleep_ms,
+            args.baseline_rev,
+        )
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
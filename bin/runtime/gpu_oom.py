@@ -0,0 +1,118 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Optional
+
+try:
+    from pynvml import (
+        nvmlInit,
+        nvmlShutdown,
+        nvmlDeviceGetCount,
+        nvmlDeviceGetHandleByIndex,
+        nvmlDeviceGetMemoryInfo,
+        nvmlDeviceGetComputeRunningProcesses,
+        NVMLError,
+    )
+
+    NVML_AVAILABLE = True
+except ImportError:
+    NVML_AVAILABLE = False
+
+FAKE_GPUS = os.environ.get("TIG_POOL_FAKE_GPUS")
+
+
+class GPUBackend(ABC):
+    @abstractmethod
+    def device_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def memory_info(self, index: int) -> Optional[tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    def process_memory(self, index: int, pids: Iterable[int]) -> Dict[int, int]:
+        pass
+
+    def close(self):
+        pass
+
+
+class NVMLBackend(GPUBackend):
+    def __init__(self):
+        nvmlInit()
+        self.handles: Dict[int, object] = {}
+
+    def _handle(self, index: int):
+        if index not in self.handles:
+            self.handles[index] = nvmlDeviceGetHandleByIndex(index)
+        return self.handles[index]
+
+    def device_count(self) -> int:
+        try:
+            return nvmlDeviceGetCount()
+        except NVMLError:
+            return 0
+
+    def memory_info(self, index: int) -> Optional[tuple[int, int]]:
+        try:
+            info = nvmlDeviceGetMemoryInfo(self._handle(index))
+        except NVMLError:
+            return None
+        return info.used, info.total
+
+    def process_memory(self, index: int, pids: Iterable[int]) -> Dict[int, int]:
+        pids = set(pids)
+        try:
+            return {
+                p.pid: p.usedGpuMemory or 0
+                for p in nvmlDeviceGetComputeRunningProcesses(self._handle(index))
+                if p.pid in pids
+            }
+        except NVMLError:
+            return {}
+
+    def close(self):
+        try:
+            nvmlShutdown()
+        except NVMLError:
+            pass
+
+
+class FakeGPUBackend(GPUBackend):
+    def __init__(self, path: str):
+        self.path = path
+
+    def _devices(self) -> list:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get("devices", [])
+        except (OSError, ValueError):
+            return []
+
+    def device_count(self) -> int:
+        return len(self._devices())
+
+    def memory_info(self, index: int) -> Optional[tuple[int, int]]:
+        devices = self._devices()
+        if index >= len(devices):
+            return None
+        return devices[index]["used"], devices[index]["total"]
+
+    def process_memory(self, index: int, pids: Iterable[int]) -> Dict[int, int]:
+        devices = self._devices()
+        if index >= len(devices):
+            return {}
+        processes = devices[index].get("processes", {})
+        return {pid: processes[str(pid)] for pid in pids if str(pid) in processes}
+
+
+def create_gpu_backend() -> Optional[GPUBackend]:
+    if FAKE_GPUS:
+        return FakeGPUBackend(FAKE_GPUS)
+    if not NVML_AVAILABLE:
+        return None
+    try:
+        return NVMLBackend()
+    except NVMLError:
+        return None
@@ -0,0 +1,67 @@
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Sequence
+
+KILL_BUDGET = 0
+KILL_WINDOW = 5.0
+TERM_GRACE = 0.5
+RELEASE_TIMEOUT = 2.0
+RESUME_SETTLE = 0.5
+PRESSURE_ACTIONS = ("kill", "suspend")
+
+
+@dataclass
+class KillDecision:
+    usage: float
+    projected: float
+    victims: List[Any] = field(default_factory=list)
+    budget_exhausted: bool = False
+
+
+class KillPolicy:
+    def __init__(
+        self,
+        high_watermark: float,
+        low_watermark: float,
+        kill_budget: int = KILL_BUDGET,
+        kill_window: float = KILL_WINDOW,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.kill_budget = kill_budget
+        self.kill_window = kill_window
+        self.clock = clock
+        self.kills: deque = deque()
+
+    def budget_left(self) -> int:
+        if self.kill_budget <= 0:
+            return 1 << 30
+        now = self.clock()
+        while self.kills and now - self.kills[0] >= self.kill_window:
+            self.kills.popleft()
+        return max(self.kill_budget - len(self.kills), 0)
+
+    def plan(
+        self, usage: float, total_bytes: int, tasks: Sequence[Any]
+    ) -> KillDecision:
+        decision = KillDecision(usage=usage, projected=usage)
+        if usage <= self.high_watermark:
+            return decision
+        left = self.budget_left()
+        for task in sorted(tasks, key=lambda t: t.oom_score, reverse=True):
+            if decision.projected <= self.low_watermark:
+                break
+            if len(decision.victims) >= left:
+                decision.budget_exhausted = True
+                break
+            decision.victims.append(task)
+            if task.memory <= 0 or total_bytes <= 0:
+                break
+            decision.projected -= task.memory / total_bytes
+        return decision
+
+    def record_kill(self):
+        if self.kill_budget > 0:
+            self.kills.append(self.clock())
@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from scheduler_oom import RETRY_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+METRICS_ADDR = os.environ.get("TIG_POOL_METRICS_ADDR", "127.0.0.1")
+TEXTFILE_INTERVAL = 5.0
+RATE_WINDOW = 60.0
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class BatchMetrics:
+    def __init__(self, watchdog, mode: str):
+        self.watchdog = watchdog
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.outcomes: Counter = Counter()
+        self.events: Counter = Counter()
+        self.buckets: Dict[str, List[int]] = defaultdict(
+            lambda: [0] * len(LATENCY_BUCKETS)
+        )
+        self.latency_sum: Counter = Counter()
+        self.latency_count: Counter = Counter()
+        self.completions: Dict[str, deque] = defaultdict(deque)
+        self.sources: Dict[str, Callable[[], int]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._textfile: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        watchdog.add_event_listener(self.on_event)
+
+    def track(self, **sources: Callable[[], int]):
+        self.sources.update(sources)
+
+    def on_event(self, record: Dict[str, Any]):
+        if record["event"] in ("kill", "suspend", "resume", "budget_exhausted"):
+            with self.lock:
+                self.events[(record["event"], record.get("memory", ""))] += 1
+
+    def record(self, record: Dict[str, Any]):
+        if "event" in record:
+            return
+        stage = record["stage"]
+        outcome = record["outcome"]
+        if outcome in RETRY_OUTCOMES:
+            outcome = "retry"
+        elif outcome not in ("ok", "abandoned"):
+            outcome = "error"
+        with self.lock:
+            self.outcomes[(stage, outcome)] += 1
+            if outcome != "ok":
+                return
+            wall = record["wall"]
+            buckets = self.buckets[stage]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if wall <= bound:
+                    buckets[i] += 1
+            self.latency_sum[stage] += wall
+            self.latency_count[stage] += 1
+            self.completions[stage].append(time.time())
+
+    def render(self) -> str:
+        mode = f'mode="{self.mode}"'
+        now = time.time()
+        elapsed = max(now - self.started_at, 1e-9)
+        window = min(elapsed, RATE_WINDOW)
+        with self.lock:
+            outcomes = sorted(self.outcomes.items())
+            recent = {}
+            for stage, completions in self.completions.items():
+                while completions and completions[0] < now - RATE_WINDOW:
+                    completions.popleft()
+                recent[stage] = len(completions)
+            stages = sorted({stage for (stage, _), _ in outcomes})
+            events = sorted(self.events.items())
+            buckets = sorted((stage, list(b)) for stage, b in self.buckets.items())
+            latency_sum = dict(self.latency_sum)
+            latency_count = dict(self.latency_count)
+        lines = ["# TYPE tig_batch_nonces_total counter"]
+        for (stage, outcome), count in outcomes:
+            lines.append(
+                f'tig_batch_nonces_total{{{mode},stage="{stage}",outcome="{outcome}"}} {count}'
+            )
+        lines.append("# TYPE tig_batch_nonces_per_second gauge")
+        for stage in stages:
+            rate = recent.get(stage, 0) / window
+            lines.append(
+                f'tig_batch_nonces_per_second{{{mode},stage="{stage}"}} {rate:.6f}'
+            )
+        lines.append("# TYPE tig_batch_nonce_latency_seconds histogram")
+        for stage, counts in buckets:
+            labels = f'{mode},stage="{stage}"'
+            for bound, count in zip(LATENCY_BUCKETS, counts):
+                lines.append(
+                    f'tig_batch_nonce_latency_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines += [
+                f'tig_batch_nonce_latency_seconds_bucket{{{labels},le="+Inf"}} {latency_count[stage]}',
+                f"tig_batch_nonce_latency_seconds_sum{{{labels}}} {latency_sum[stage]:.6f}",
+                f"tig_batch_nonce_latency_seconds_count{{{labels}}} {latency_count[stage]}",
+            ]
+        lines.append("# TYPE tig_batch_watchdog_events_total counter")
+        for (event, memory), count in events:
+            lines.append(
+                f'tig_batch_watchdog_events_total{{{mode},event="{event}",memory="{memory}"}} {count}'
+            )
+        for name, source in sorted(self.sources.items()):
+            lines += [
+                f"# TYPE tig_batch_{name} gauge",
+                f"tig_batch_{name}{{{mode}}} {source()}",
+            ]
+        memory = self.watchdog.memory_type
+        lines += [
+            "# TYPE tig_batch_retry_queue gauge",
+            f"tig_batch_retry_queue{{{mode}}} {self.watchdog.get_pending_restart_count()}",
+            "# TYPE tig_batch_memory_usage_ratio gauge",
+            f'tig_batch_memory_usage_ratio{{{mode},memory="{memory}"}} {self.watchdog.get_memory_usage():.4f}',
+            "# TYPE tig_batch_uptime_seconds gauge",
+            f"tig_batch_uptime_seconds{{{mode}}} {elapsed:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def _flush_textfile(self):
+        try:
+            self.write_textfile(self._textfile)
+        except OSError as e:
+            logger.warning(f"Cannot write metrics textfile {self._textfile}: {e}")
+
+    def _textfile_loop(self):
+        while not self._stop_event.wait(TEXTFILE_INTERVAL):
+            self._flush_textfile()
+
+    def serve(self, port: int, addr: str = METRICS_ADDR):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((addr, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on {addr}:{self._server.server_port}")
+
+    def start(self, port: Optional[int] = None, textfile: Optional[str] = None):
+        if textfile:
+            self._textfile = textfile
+            self._thread = threading.Thread(target=self._textfile_loop, daemon=True)
+            self._thread.start()
+        if port is not None:
+            self.serve(port)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._textfile:
+            self._flush_textfile()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def create_metrics(
+    watchdog, mode: str, port: Optional[int] = None, textfile: Optional[str] = None
+) -> Optional[BatchMetrics]:
+    if port is None and not textfile:
+        return None
+    metrics = BatchMetrics(watchdog, mode)
+    try:
+        metrics.start(port, textfile)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint unavailable: {e}")
+    return metrics
@@ -0,0 +1,43 @@
+from typing import Iterator
+
+NONCE_ORDERS = ("sequential", "interleaved", "strided")
+ORDER_STRIDE = 64
+
+
+def shard_range(
+    start_nonce: int, num_nonces: int, shard_index: int, shard_count: int
+) -> tuple[int, int]:
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index}/{shard_count}")
+    begin = num_nonces * shard_index // shard_count
+    end = num_nonces * (shard_index + 1) // shard_count
+    return start_nonce + begin, end - begin
+
+
+def sequential_order(num_nonces: int) -> Iterator[int]:
+    return iter(range(num_nonces))
+
+
+def strided_order(num_nonces: int, stride: int = ORDER_STRIDE) -> Iterator[int]:
+    for offset in range(min(stride, num_nonces)):
+        yield from range(offset, num_nonces, stride)
+
+
+def interleaved_order(num_nonces: int) -> Iterator[int]:
+    bits = max(num_nonces - 1, 0).bit_length()
+    for i in range(1 << bits):
+        j = int(f"{i:0{bits}b}"[::-1], 2) if bits else 0
+        if j < num_nonces:
+            yield j
+
+
+def create_nonce_order(order: str, start_nonce: int, num_nonces: int) -> Iterator[int]:
+    if order == "sequential":
+        offsets = sequential_order(num_nonces)
+    elif order == "strided":
+        offsets = strided_order(num_nonces)
+    elif order == "interleaved":
+        offsets = interleaved_order(num_nonces)
+    else:
+        raise ValueError(f"Unknown nonce order: {order}")
+    return (start_nonce + i for i in offsets)
@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics_oom import BatchMetrics
+from scheduler_oom import RETRY_OUTCOMES, ChildExit
+
+
+class NonceTrace:
+    def __init__(self, path: Optional[str] = None, **batch):
+        self.file = open(path, "a", buffering=1) if path else None
+        self.lock = threading.Lock()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.started_at = time.time()
+        self.queued_at: Dict[tuple[str, int], float] = {}
+        self.retries: Counter = Counter()
+        self._write({"event": "batch", "t": round(self.started_at, 3), **batch})
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        with self.lock:
+            self._listeners.append(callback)
+
+    def _write(self, record: Dict[str, Any]):
+        if self.file is not None:
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        for callback in self._listeners:
+            callback(record)
+
+    def record(self, nonce: int, stage: str, child: ChildExit, outcome: Optional[str]):
+        rusage = child.rusage
+        with self.lock:
+            queued_at = self.queued_at.pop((stage, nonce), self.started_at)
+            retries = self.retries[(stage, nonce)]
+            if outcome in RETRY_OUTCOMES:
+                self.retries[(stage, nonce)] += 1
+                self.queued_at[(stage, nonce)] = child.exited_at
+            elif outcome is None and stage == "runtime":
+                self.queued_at[("verify", nonce)] = child.exited_at
+            self._write(
+                {
+                    "nonce": nonce,
+                    "stage": stage,
+                    "t": round(child.exited_at, 3),
+                    "queue": round(max(child.spawned_at - queued_at, 0.0), 4),
+                    "spawn": round(child.spawn_time, 4),
+                    "wall": round(child.exited_at - child.spawned_at, 4),
+                    "utime": round(rusage.ru_utime, 4) if rusage else None,
+                    "stime": round(rusage.ru_stime, 4) if rusage else None,
+                    "maxrss": rusage.ru_maxrss * 1024 if rusage else None,
+                    "exit": child.returncode,
+                    "retries": retries,
+                    "outcome": outcome or "ok",
+                }
+            )
+
+    def wrap(
+        self, nonce: int, stage: str, on_exit: Callable[[ChildExit], tuple]
+    ) -> Callable[[ChildExit], tuple]:
+        def traced(child: ChildExit) -> tuple:
+            try:
+                result = on_exit(child)
+            except Exception as e:
+                self.record(nonce, stage, child, str(e))
+                raise
+            self.record(nonce, stage, child, result[1])
+            return result
+
+        return traced
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+
+
+def create_nonce_trace(
+    path: Optional[str], metrics: Optional[BatchMetrics] = None, **batch
+) -> Optional[NonceTrace]:
+    if not path and metrics is None:
+        return None
+    trace = NonceTrace(path, **batch)
+    if metrics is not None:
+        trace.add_listener(metrics.record)
+    return trace
@@ -0,0 +1,155 @@
+import glob
+import logging
+import os
+import re
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SYSFS_ROOT = "/sys/devices/system"
+PLACEMENTS = ("none", "core", "thread", "node")
+
+
+def parse_cpulist(text: str) -> List[int]:
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _read_int(path: str, default: int = 0) -> int:
+    try:
+        with open(path, "r") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class CPU:
+    cpu: int
+    node: int
+    package: int
+    core: int
+
+
+def read_topology(
+    root: str = SYSFS_ROOT, allowed: Optional[FrozenSet[int]] = None
+) -> List[CPU]:
+    allowed = allowed if allowed is not None else frozenset(os.sched_getaffinity(0))
+    nodes: Dict[int, int] = {}
+    for path in glob.glob(f"{root}/node/node[0-9]*/cpulist"):
+        node = int(re.search(r"node(\d+)/cpulist$", path).group(1))
+        try:
+            with open(path, "r") as f:
+                for cpu in parse_cpulist(f.read()):
+                    nodes[cpu] = node
+        except (OSError, ValueError):
+            continue
+    return [
+        CPU(
+            cpu,
+            nodes.get(cpu, 0),
+            _read_int(f"{root}/cpu/cpu{cpu}/topology/physical_package_id"),
+            _read_int(f"{root}/cpu/cpu{cpu}/topology/core_id", cpu),
+        )
+        for cpu in sorted(allowed)
+    ]
+
+
+@dataclass
+class Slot:
+    cpus: FrozenSet[int]
+    node: int
+    running: int = 0
+
+    @property
+    def cpulist(self) -> str:
+        return ",".join(str(cpu) for cpu in sorted(self.cpus))
+
+
+def _interleave(groups: Dict[int, List]) -> List:
+    ordered = []
+    for i in range(max((len(g) for g in groups.values()), default=0)):
+        for node in sorted(groups):
+            if i < len(groups[node]):
+                ordered.append(groups[node][i])
+    return ordered
+
+
+def build_slots(topology: List[CPU], placement: str) -> List[Slot]:
+    if placement == "node":
+        by_node: Dict[int, List[int]] = {}
+        for c in topology:
+            by_node.setdefault(c.node, []).append(c.cpu)
+        return [Slot(frozenset(cpus), node) for node, cpus in sorted(by_node.items())]
+    cores: Dict[tuple[int, int, int], List[CPU]] = {}
+    for c in topology:
+        cores.setdefault((c.node, c.package, c.core), []).append(c)
+    depth = 1 if placement == "core" else max(len(t) for t in cores.values())
+    slots = []
+    for sibling in range(depth):
+        groups: Dict[int, List[Slot]] = {}
+        for (node, _, _), threads in sorted(cores.items()):
+            if sibling < len(threads):
+                cpu = threads[sibling].cpu
+                groups.setdefault(node, []).append(Slot(frozenset([cpu]), node))
+        slots += _interleave(groups)
+    return slots
+
+
+class Placement:
+    def __init__(self, slots: List[Slot], bind_memory: bool = True):
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.numactl = shutil.which("numactl")
+        self.taskset = shutil.which("taskset")
+        self.bind_memory = bind_memory and len({s.node for s in slots}) > 1
+
+    def acquire(self) -> Slot:
+        with self.lock:
+            slot = min(self.slots, key=lambda s: s.running)
+            slot.running += 1
+            return slot
+
+    def release(self, slot: Slot):
+        with self.lock:
+            slot.running -= 1
+
+    def command(self, slot: Slot, cmd: List[str]) -> List[str]:
+        if self.numactl:
+            prefix = [self.numactl, f"--physcpubind={slot.cpulist}"]
+            if self.bind_memory:
+                prefix.append(f"--preferred={slot.node}")
+            return prefix + ["--"] + cmd
+        if self.taskset:
+            return [self.taskset, "--cpu-list", slot.cpulist] + cmd
+        return cmd
+
+    def pin(self, pid: int, slot: Slot):
+        if self.numactl or self.taskset:
+            return
+        try:
+            os.sched_setaffinity(pid, slot.cpus)
+        except OSError:
+            pass
+
+
+def create_placement(placement: str, root: str = SYSFS_ROOT) -> Optional[Placement]:
+    if placement == "none":
+        return None
+    topology = read_topology(root)
+    if not topology:
+        return None
+    slots = build_slots(topology, placement)
+    nodes = len({s.node for s in slots})
+    logger.info(
+        f"[placement] {placement}: {len(slots)} slots over {nodes} NUMA node(s)"
+    )
+    return Placement(slots)
@@ -0,0 +1,177 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from result_store_oom import write_json_atomic
+from watchdog_oom import BaseWatchdog, NonceTask
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PATH = os.environ.get(
+    "TIG_POOL_PROFILE_PATH",
+    os.path.expanduser("~/.cache/tig-pool/footprints.json"),
+)
+MAX_SAMPLES = 128
+MAX_PROFILES = 64
+MIN_SAMPLES = 3
+SAFETY_MARGIN = 1.1
+VRAM_SAMPLE_INTERVAL = 1.0
+
+
+def challenge_algorithm(settings_json: str, so_path: str) -> tuple[str, str]:
+    try:
+        settings = json.loads(settings_json)
+    except json.JSONDecodeError:
+        settings = {}
+    if not isinstance(settings, dict):
+        settings = {}
+    challenge = settings.get("challenge_id") or "unknown"
+    algorithm = (
+        settings.get("algorithm_id") or os.path.splitext(os.path.basename(so_path))[0]
+    )
+    return challenge, algorithm
+
+
+def profile_key(settings_json: str, so_path: str, memory_type: str) -> str:
+    challenge, algorithm = challenge_algorithm(settings_json, so_path)
+    return f"{challenge}/{algorithm}/{memory_type.lower()}"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+def load_profiles(path: str = PROFILE_PATH) -> Dict[str, dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("profiles", {})
+    except (OSError, ValueError):
+        return {}
+
+
+class FootprintProfile:
+    def __init__(self, key: str, memory_type: str, path: str = PROFILE_PATH):
+        self.key = key
+        self.memory_type = memory_type
+        self.path = path
+        self.lock = threading.Lock()
+        self.peaks_mb: List[int] = list(
+            load_profiles(path).get(key, {}).get("peaks_mb", [])
+        )
+        self._new_peaks: List[int] = []
+
+    def record(self, peak_bytes: int):
+        if peak_bytes <= 0:
+            return
+        with self.lock:
+            self._new_peaks.append(peak_bytes // (1024 * 1024))
+
+    def record_task(self, task: Optional[NonceTask]):
+        if task is not None and self.memory_type == "VRAM":
+            self.record(task.peak_memory)
+
+    def estimate_mb(self) -> Optional[int]:
+        if len(self.peaks_mb) < MIN_SAMPLES:
+            return None
+        return int(percentile(self.peaks_mb, 0.95) * SAFETY_MARGIN) or None
+
+    def safe_workers(
+        self, max_workers: int, used_mb: int, total_mb: int, high: float
+    ) -> int:
+        estimate = self.estimate_mb()
+        if estimate is None or total_mb <= 0:
+            return max_workers
+        budget = total_mb * high - used_mb
+        return min(max_workers, max(1, int(budget // estimate)))
+
+    def save(self):
+        with self.lock:
+            new_peaks, self._new_peaks = self._new_peaks, []
+        if not new_peaks:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                profiles = load_profiles(self.path)
+                entry = profiles.pop(self.key, {})
+                peaks = (entry.get("peaks_mb", []) + new_peaks)[-MAX_SAMPLES:]
+                profiles[self.key] = {"peaks_mb": peaks, "updated": time.time()}
+                if len(profiles) > MAX_PROFILES:
+                    keep = sorted(profiles, key=lambda k: profiles[k].get("updated", 0))
+                    for key in keep[: len(profiles) - MAX_PROFILES]:
+                        del profiles[key]
+                write_json_atomic(self.path, {"profiles": profiles})
+        except OSError as e:
+            logger.warning(f"Cannot save footprint profile {self.path}: {e}")
+            return
+        self.peaks_mb = peaks
+
+
+def create_profile(
+    settings_json: str,
+    so_path: str,
+    watchdog: BaseWatchdog,
+    disable: bool,
+    path: Optional[str] = None,
+) -> Optional[FootprintProfile]:
+    memory_type = watchdog.memory_type
+    if disable or memory_type not in ("RAM", "VRAM"):
+        return None
+    if memory_type == "VRAM":
+        watchdog.sample_interval = VRAM_SAMPLE_INTERVAL
+    return FootprintProfile(
+        profile_key(settings_json, so_path, memory_type),
+        memory_type,
+        path or PROFILE_PATH,
+    )
+
+
+def size_workers(
+    profile: Optional[FootprintProfile],
+    watchdog: BaseWatchdog,
+    max_workers: int,
+    high_watermark: float,
+) -> int:
+    if profile is None:
+        return max_workers
+    used, total, _ = watchdog.get_memory_info()
+    workers = profile.safe_workers(max_workers, used, total, high_watermark)
+    if workers < max_workers:
+        logger.info(
+            f"Footprint {profile.key}: ~{profile.estimate_mb()}MB per nonce, using {workers}/{max_workers} workers"
+        )
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump TIG pool memory footprints")
+    parser.add_argument("--profile-path", default=PROFILE_PATH)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.profile_path)
+    if args.json:
+        print(json.dumps(profiles, indent=2))
+        return
+    print(f"{'profile':<40} {'n':>4} {'p50MB':>8} {'p95MB':>8} {'maxMB':>8}  updated")
+    for key in sorted(profiles):
+        peaks = profiles[key].get("peaks_mb", [])
+        if not peaks:
+            continue
+        updated = time.strftime(
+            "%Y-%m-%d %H:%M", time.localtime(profiles[key].get("updated", 0))
+        )
+        print(
+            f"{key:<40} {len(peaks):>4} {percentile(peaks, 0.5):>8} {percentile(peaks, 0.95):>8} {max(peaks):>8}  {updated}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import sys
+from typing import Callable, Dict, List
+
+POLICIES: Dict[str, Callable[[float, int], float]] = {
+    "youngest": lambda age, memory: 1000 / (1 + age),
+    "footprint": lambda age, memory: (memory + 1) / (1 + age),
+}
+
+
+def load_trace(path: str) -> List[dict]:
+    samples = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                sample = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if "tasks" in sample:
+                samples.append(sample)
+    return samples
+
+
+def replay(samples: List[dict], policy: str, high: float, low: float) -> dict:
+    score = POLICIES[policy]
+    killed: Dict[str, tuple[float, int]] = {}
+    freed_mb = 0.0
+    for sample in samples:
+        total = sample["total"]
+        if not total:
+            continue
+        live = {
+            nonce: (age, memory // (1024 * 1024))
+            for nonce, (age, memory) in sample["tasks"].items()
+            if nonce not in killed
+        }
+        used = sample["used"] - freed_mb
+        if used / total <= high:
+            continue
+        while used / total > low and live:
+            nonce = max(live, key=lambda n: score(*live[n]))
+            age, memory = live.pop(nonce)
+            killed[nonce] = (age, memory)
+            freed_mb += memory
+            used -= memory
+    work_lost = sum(age for age, _ in killed.values())
+    return {
+        "policy": policy,
+        "kills": len(killed),
+        "freed_mb": int(freed_mb),
+        "work_lost_s": round(work_lost, 1),
+        "mb_per_lost_s": round(freed_mb / work_lost, 1) if work_lost else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a watchdog memory trace")
+    parser.add_argument("trace")
+    parser.add_argument("--mem-high", type=float, default=90.0)
+    parser.add_argument("--mem-low", type=float, default=75.0)
+    parser.add_argument("--policy", choices=list(POLICIES), action="append")
+    args = parser.parse_args()
+
+    samples = load_trace(args.trace)
+    if not samples:
+        print(f"No samples in {args.trace}", file=sys.stderr)
+        sys.exit(1)
+    for policy in args.policy or list(POLICIES):
+        result = replay(samples, policy, args.mem_high / 100.0, args.mem_low / 100.0)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import fcntl
+import glob
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, Optional
+
+RESULT_STORES = ("files", "segment")
+
+
+def fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path: str, obj):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(path) or ".")
+
+
+class ResultStore(ABC):
+    def __init__(self, output_dir: str, shard: Optional[str] = None):
+        self.output_dir = output_dir
+        self.shard = shard
+        self.partial_dir = f"{output_dir}/{shard_name('.partial', shard)}"
+
+    def report_path(self, name: str) -> str:
+        return f"{self.output_dir}/{shard_name(name, self.shard)}.json"
+
+    def staged_path(self, nonce: int) -> str:
+        return f"{self.output_dir}/{nonce}.json"
+
+    def partial_path(self, nonce: int) -> str:
+        return f"{self.partial_dir}/{nonce}.json"
+
+    def discard_partials(self):
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def discard_partial(self, nonce: int):
+        try:
+            os.unlink(self.partial_path(nonce))
+        except FileNotFoundError:
+            pass
+
+    def promote(self, nonce: int) -> bool:
+        partial = self.partial_path(nonce)
+        try:
+            with open(partial, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(partial, self.staged_path(nonce))
+        except FileNotFoundError:
+            return False
+        fsync_dir(self.output_dir)
+        return True
+
+    @abstractmethod
+    def is_computed(self, nonce: int) -> bool:
+        pass
+
+    @abstractmethod
+    def iter_computed(self) -> Iterator[int]:
+        pass
+
+    def scan_computed(self, start_nonce: int, num_nonces: int) -> bytearray:
+        bitmap = bytearray((num_nonces + 7) // 8)
+        for nonce in self.iter_computed():
+            offset = nonce - start_nonce
+            if 0 <= offset < num_nonces:
+                bitmap[offset >> 3] |= 1 << (offset & 7)
+        return bitmap
+
+    def _iter_staged(self) -> Iterator[int]:
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext == ".json" and stem.isdigit():
+                    yield int(stem)
+
+    @abstractmethod
+    def load(self, nonce: int) -> dict:
+        pass
+
+    @abstractmethod
+    def commit(self, nonce: int, quality: Optional[int] = None):
+        pass
+
+    def solution_path(self, nonce: int) -> str:
+        return self.staged_path(nonce)
+
+    def release_solution_path(self, nonce: int, path: str):
+        pass
+
+    def close(self):
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
+
+
+class FileResultStore(ResultStore):
+    def is_computed(self, nonce: int) -> bool:
+        return os.path.exists(self.staged_path(nonce))
+
+    def iter_computed(self) -> Iterator[int]:
+        return self._iter_staged()
+
+    def load(self, nonce: int) -> dict:
+        with open(self.staged_path(nonce), "r") as f:
+            return json.load(f)
+
+    def commit(self, nonce: int, quality: Optional[int] = None):
+        if quality is None:
+            return
+        d = self.load(nonce)
+        d["quality"] = quality
+        write_json_atomic(self.staged_path(nonce), d)
+
+
+class SegmentResultStore(ResultStore):
+    SEGMENT_FILE = "results.seg"
+    INDEX_FILE = "results.idx"
+    RECORD_HEADER = struct.Struct("<QI")
+    INDEX_ENTRY = struct.Struct("<QQI")
+
+    def __init__(self, output_dir: str, shard: Optional[str] = None):
+        super().__init__(output_dir, shard)
+        self.segment_path = f"{output_dir}/{self.SEGMENT_FILE}"
+        self.index_path = f"{output_dir}/{self.INDEX_FILE}"
+        self.scratch_dir = f"{output_dir}/.verify"
+        self.lock = threading.Lock()
+        self.index: Dict[int, tuple[int, int]] = {}
+        self._segment = open(self.segment_path, "ab+")
+        try:
+            fcntl.flock(self._segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._segment.close()
+            raise RuntimeError(
+                f"{self.segment_path} is in use by another process; "
+                "give each shard its own --output-dir"
+            )
+        self._index_file = open(self.index_path, "ab+")
+        self._recover()
+
+    def _recover(self):
+        self._index_file.seek(0)
+        data = self._index_file.read()
+        entry_size = self.INDEX_ENTRY.size
+        segment_size = os.fstat(self._segment.fileno()).st_size
+        valid = len(data) % entry_size == 0
+        for pos in range(0, len(data) - len(data) % entry_size, entry_size):
+            nonce, offset, length = self.INDEX_ENTRY.unpack_from(data, pos)
+            if offset + length > segment_size:
+                valid = False
+                continue
+            self.index[nonce] = (offset, length)
+        if not valid:
+            self._index_file.truncate(0)
+            self._index_file.write(
+                b"".join(
+                    self.INDEX_ENTRY.pack(n, o, size)
+                    for n, (o, size) in self.index.items()
+                )
+            )
+
+        offset = max((o + size for o, size in self.index.values()), default=0)
+        header_size = self.RECORD_HEADER.size
+        while offset + header_size <= segment_size:
+            self._segment.seek(offset)
+            nonce, length = self.RECORD_HEADER.unpack(self._segment.read(header_size))
+            if offset + header_size + length > segment_size:
+                break
+            self._index_record(nonce, offset + header_size, length)
+            offset += header_size + length
+        if offset < segment_size:
+            self._segment.truncate(offset)
+        self._index_file.flush()
+
+    def _index_record(self, nonce: int, offset: int, length: int):
+        self.index[nonce] = (offset, length)
+        self._index_file.write(self.INDEX_ENTRY.pack(nonce, offset, length))
+
+    def _append(self, nonce: int, payload: bytes):
+        with self.lock:
+            self._segment.seek(0, os.SEEK_END)
+            offset = self._segment.tell() + self.RECORD_HEADER.size
+            self._segment.write(self.RECORD_HEADER.pack(nonce, len(payload)) + payload)
+            self._segment.flush()
+            self._index_record(nonce, offset, len(payload))
+            self._index_file.flush()
+
+    def _read(self, nonce: int) -> bytes:
+        with self.lock:
+            offset, length = self.index[nonce]
+            return os.pread(self._segment.fileno(), length, offset)
+
+    def is_computed(self, nonce: int) -> bool:
+        return nonce in self.index or os.path.exists(self.staged_path(nonce))
+
+    def iter_computed(self) -> Iterator[int]:
+        with self.lock:
+            indexed = list(self.index)
+        yield from indexed
+        yield from self._iter_staged()
+
+    def load(self, nonce: int) -> dict:
+        if nonce in self.index:
+            return json.loads(self._read(nonce))
+        with open(self.staged_path(nonce), "r") as f:
+            return json.load(f)
+
+    def commit(self, nonce: int, quality: Optional[int] = None):
+        staged = self.staged_path(nonce)
+        if os.path.exists(staged):
+            with open(staged, "rb") as f:
+                payload = f.read()
+        elif quality is not None and nonce in self.index:
+            payload = self._read(nonce)
+        else:
+            return
+        if quality is not None:
+            d = json.loads(payload)
+            d["quality"] = quality
+            payload = json.dumps(d).encode()
+        self._append(nonce, payload)
+        if os.path.exists(staged):
+            os.unlink(staged)
+
+    def solution_path(self, nonce: int) -> str:
+        staged = self.staged_path(nonce)
+        if os.path.exists(staged) or nonce not in self.index:
+            return staged
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        path = f"{self.scratch_dir}/{nonce}.json"
+        with open(path, "wb") as f:
+            f.write(self._read(nonce))
+        return path
+
+    def release_solution_path(self, nonce: int, path: str):
+        if path != self.staged_path(nonce) and os.path.exists(path):
+            os.unlink(path)
+
+    def close(self):
+        with self.lock:
+            self._segment.close()
+            self._index_file.close()
+        super().close()
+
+
+class QualityIndex:
+    NAME = "qualities"
+    HEADER = struct.Struct("<QQ")
+    MISSING = -(2**63)
+
+    def __init__(
+        self,
+        output_dir: str,
+        start_nonce: int,
+        num_nonces: int,
+        shard: Optional[str] = None,
+    ):
+        self.path = f"{output_dir}/{shard_name(self.NAME, shard)}.bin"
+        self.start_nonce = start_nonce
+        self.num_nonces = num_nonces
+        size = self.HEADER.size + 8 * num_nonces
+        header = self.HEADER.pack(start_nonce, num_nonces)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            reuse = (
+                os.fstat(fd).st_size == size
+                and os.pread(fd, self.HEADER.size, 0) == header
+            )
+            if not reuse:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, header, 0)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if not reuse:
+            self._mmap[self.HEADER.size :] = (
+                struct.pack("<q", self.MISSING) * num_nonces
+            )
+        self.values = memoryview(self._mmap)[self.HEADER.size :].cast("q")
+
+    def set(self, nonce: int, quality: int):
+        self.values[nonce - self.start_nonce] = quality
+
+    def get(self, nonce: int) -> Optional[int]:
+        quality = self.values[nonce - self.start_nonce]
+        return None if quality == self.MISSING else quality
+
+    def close(self):
+        self.values.release()
+        self._mmap.flush()
+        self._mmap.close()
+
+
+def load_qualities(output_dir: str) -> Dict[int, int]:
+    qualities = {}
+    for path in sorted(glob.glob(f"{output_dir}/{QualityIndex.NAME}*.bin")):
+        with open(path, "rb") as f:
+            data = f.read()
+        start_nonce, num_nonces = QualityIndex.HEADER.unpack_from(data)
+        values = struct.unpack_from(f"<{num_nonces}q", data, QualityIndex.HEADER.size)
+        qualities.update(
+            (start_nonce + i, quality)
+            for i, quality in enumerate(values)
+            if quality != QualityIndex.MISSING
+        )
+    return qualities
+
+
+def shard_name(name: str, shard: Optional[str]) -> str:
+    return f"{name}.{shard}" if shard else name
+
+
+def bitmap_test(bitmap: bytearray, offset: int) -> bool:
+    return bool(bitmap[offset >> 3] & (1 << (offset & 7)))
+
+
+def create_result_store(
+    kind: str, output_dir: str, shard: Optional[str] = None
+) -> ResultStore:
+    if kind == "segment":
+        return SegmentResultStore(output_dir, shard)
+    return FileResultStore(output_dir, shard)
@@ -0,0 +1,203 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from gpu_oom import GPUBackend, create_gpu_backend
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+SAMPLER_PATH = os.environ.get(
+    "TIG_POOL_SAMPLER_PATH",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        f"tig-pool-sampler-{os.getuid()}",
+    ),
+)
+SAMPLE_INTERVAL = 0.01
+STALE_AFTER = 1.0
+MAX_DEVICES = 16
+
+
+def private_opener(path: str, flags: int) -> int:
+    return os.open(path, flags | os.O_NOFOLLOW, 0o600)
+
+
+class SharedSampler:
+    HEADER = struct.Struct("<QdII")
+    SLOT = struct.Struct("<QQ")
+
+    def __init__(
+        self,
+        path: str = SAMPLER_PATH,
+        interval: float = SAMPLE_INTERVAL,
+        backend_factory: Callable[[], Optional[GPUBackend]] = create_gpu_backend,
+    ):
+        self.path = path
+        self.interval = interval
+        self.backend_factory = backend_factory
+        self.size = self.HEADER.size + self.SLOT.size * (MAX_DEVICES + 1)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            if os.fstat(fd).st_uid != os.getuid():
+                raise PermissionError(f"{path} is owned by another user")
+            os.fchmod(fd, 0o600)
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._mmap = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        self.lock = threading.Lock()
+        self._lock_file = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_attempt = 0.0
+        self.try_lead()
+
+    @property
+    def leading(self) -> bool:
+        return self._thread is not None
+
+    def try_lead(self) -> bool:
+        with self.lock:
+            if self._thread is not None:
+                return True
+            if time.time() - self._last_attempt < STALE_AFTER:
+                return False
+            self._last_attempt = time.time()
+            lock_file = open(f"{self.path}.lock", "a", opener=private_opener)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+            self._thread.start()
+        logger.debug(f"Sampling memory for this host into {self.path}")
+        return True
+
+    def _sample_loop(self):
+        backend = self.backend_factory()
+        try:
+            count = min(backend.device_count(), MAX_DEVICES) if backend else 0
+            while not self._stop_event.is_set():
+                ram = None
+                if PSUTIL_AVAILABLE:
+                    mem = psutil.virtual_memory()
+                    ram = (mem.total - mem.available, mem.total)
+                devices = [backend.memory_info(i) for i in range(count)]
+                self._publish(ram, devices)
+                self._stop_event.wait(self.interval)
+        finally:
+            if backend is not None:
+                backend.close()
+
+    def _publish(self, ram: Optional[tuple[int, int]], devices: List):
+        seq = self.HEADER.unpack_from(self._mmap)[0]
+        seq += 1 if seq % 2 == 0 else 2
+        self.HEADER.pack_into(self._mmap, 0, seq, time.time(), os.getpid(), 0)
+        offset = self.HEADER.size
+        for slot in [ram] + devices:
+            self.SLOT.pack_into(self._mmap, offset, *(slot or (0, 0)))
+            offset += self.SLOT.size
+        self.HEADER.pack_into(
+            self._mmap, 0, seq + 1, time.time(), os.getpid(), len(devices)
+        )
+
+    def read(self) -> Optional[List[tuple[int, int]]]:
+        for _ in range(4):
+            seq, stamp, _, count = self.HEADER.unpack_from(self._mmap)
+            if seq & 1:
+                continue
+            slots = [
+                self.SLOT.unpack_from(self._mmap, self.HEADER.size + i * self.SLOT.size)
+                for i in range(count + 1)
+            ]
+            if self.HEADER.unpack_from(self._mmap)[0] != seq:
+                continue
+            if seq and time.time() - stamp < STALE_AFTER:
+                return slots
+            break
+        self.try_lead()
+        return None
+
+    def ram(self) -> Optional[tuple[int, int]]:
+        slots = self.read()
+        if not slots or not slots[0][1]:
+            return None
+        return slots[0]
+
+    def gpu(self, index: int) -> Optional[tuple[int, int]]:
+        slots = self.read()
+        if not slots or index + 1 >= len(slots) or not slots[index + 1][1]:
+            return None
+        return slots[index + 1]
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._lock_file is not None:
+            self._lock_file.close()
+        self._mmap.close()
+
+
+class SharedGPUBackend(GPUBackend):
+    def __init__(self, sampler: SharedSampler):
+        self.sampler = sampler
+        self._backend: Optional[GPUBackend] = None
+        self._probed = False
+
+    def _direct(self) -> Optional[GPUBackend]:
+        if not self._probed:
+            self._probed = True
+            self._backend = create_gpu_backend()
+        return self._backend
+
+    def device_count(self) -> int:
+        backend = self._direct()
+        return backend.device_count() if backend else 0
+
+    def memory_info(self, index: int) -> Optional[tuple[int, int]]:
+        info = self.sampler.gpu(index)
+        if info is not None:
+            return info
+        backend = self._direct()
+        return backend.memory_info(index) if backend else None
+
+    def process_memory(self, index: int, pids: Iterable[int]) -> Dict[int, int]:
+        backend = self._direct()
+        return backend.process_memory(index, pids) if backend else {}
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+
+
+_sampler: Optional[SharedSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_shared_sampler() -> Optional[SharedSampler]:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            try:
+                _sampler = SharedSampler()
+            except OSError as e:
+                logger.warning(f"Shared memory sampler unavailable: {e}")
+                return None
+        return _sampler
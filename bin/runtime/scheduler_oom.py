@@ -0,0 +1,454 @@
+import heapq
+import logging
+import os
+import queue
+import resource
+import select
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+PIDFD_AVAILABLE = hasattr(os, "pidfd_open")
+
+TAIL_LINES = 64
+MAX_LINE_BYTES = 4096
+STREAM_GRACE = 0.5
+
+RETRY_OUTCOMES = ("killed_by_oom", "cuda_oom")
+
+PRIORITY_FRESH = 0
+PRIORITY_RETRY = 1
+PRIORITY_VERIFY = 2
+
+_WAKEUP = object()
+
+
+class CompletionQueue:
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+
+    def watch(self, future: Future):
+        future.add_done_callback(self._queue.put)
+
+    def notify(self):
+        self._queue.put(_WAKEUP)
+
+    def wait(self, timeout: Optional[float] = None) -> list[Future]:
+        if timeout is not None and timeout <= 0:
+            return self._drain([])
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        return self._drain([] if item is _WAKEUP else [item])
+
+    def _drain(self, done: list[Future]) -> list[Future]:
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return done
+            if item is not _WAKEUP:
+                done.append(item)
+
+
+class PendingQueue:
+    def __init__(self, nonces: Iterable[int] = (), priority: int = PRIORITY_FRESH):
+        self._priorities: Dict[int, int] = {nonce: priority for nonce in nonces}
+        self._heap = [
+            (-priority, seq, nonce) for seq, nonce in enumerate(self._priorities)
+        ]
+        self._seq = len(self._heap)
+
+    def push(self, nonce: int, priority: int = PRIORITY_FRESH):
+        if self._priorities.get(nonce, priority - 1) >= priority:
+            return
+        self._priorities[nonce] = priority
+        heapq.heappush(self._heap, (-priority, self._seq, nonce))
+        self._seq += 1
+
+    def pop(self) -> tuple[int, int]:
+        while self._heap:
+            priority, _, nonce = heapq.heappop(self._heap)
+            if self._priorities.get(nonce) == -priority:
+                del self._priorities[nonce]
+                return nonce, -priority
+        raise KeyError("pop from an empty PendingQueue")
+
+    def __contains__(self, nonce: int) -> bool:
+        return nonce in self._priorities
+
+    def __len__(self) -> int:
+        return len(self._priorities)
+
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0.0)
+
+
+def has_oom_message(text: bytes) -> bool:
+    return b"OUT_OF_MEMORY" in text or b"out of memory" in text.lower()
+
+
+@dataclass
+class ChildExit:
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+    aborted: bool = False
+    abandoned: bool = False
+    rusage: Optional[resource.struct_rusage] = None
+    spawned_at: float = 0.0
+    spawn_time: float = 0.0
+    exited_at: float = 0.0
+
+
+class LineTail:
+    def __init__(self, max_lines: int = TAIL_LINES):
+        self.lines: deque = deque(maxlen=max_lines)
+        self._partial = bytearray()
+
+    def feed(self, data: bytes) -> bytes:
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._partial += data[: max(MAX_LINE_BYTES - len(self._partial), 0)]
+            return b""
+        complete = bytes(self._partial) + data[:end]
+        self._partial = bytearray(data[end + 1 : end + 1 + MAX_LINE_BYTES])
+        self._append(complete)
+        return complete
+
+    def close(self) -> bytes:
+        complete = bytes(self._partial)
+        self._partial.clear()
+        if complete:
+            self._append(complete)
+        return complete
+
+    def getvalue(self) -> bytes:
+        return b"\n".join(self.lines)
+
+    def _append(self, complete: bytes):
+        max_lines = self.lines.maxlen
+        self.lines.extend(
+            line[:MAX_LINE_BYTES]
+            for line in complete.rsplit(b"\n", max_lines)[-max_lines:]
+        )
+
+
+class _Child:
+    def __init__(
+        self,
+        process: subprocess.Popen,
+        on_exit: Callable[[ChildExit], Any],
+        deadline: Optional[float],
+        abort_on_stderr: Optional[Callable[[bytes], bool]],
+        spawned_at: float,
+    ):
+        self.process = process
+        self.spawned_at = spawned_at
+        self.spawn_time = time.time() - spawned_at
+        self.on_exit = on_exit
+        self.deadline = deadline
+        self.abort_on_stderr = abort_on_stderr
+        self.future: Future = Future()
+        self.future.set_running_or_notify_cancel()
+        self.stdout = LineTail()
+        self.stderr = LineTail()
+        self.open_streams = 2
+        self.pidfd: Optional[int] = None
+        self.exited_at: Optional[float] = None
+        self.timed_out = False
+        self.aborted = False
+        self.abandoned = False
+        self.rusage: Optional[resource.struct_rusage] = None
+        self.slot: Optional[Any] = None
+
+    @property
+    def killed(self) -> bool:
+        return self.timed_out or self.aborted or self.abandoned
+
+    def needs_poll(self) -> bool:
+        return self.pidfd is None and (not self.open_streams or self.killed)
+
+
+class ProcessReaper:
+    def __init__(self, placement: Optional[Any] = None):
+        self.placement = placement
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._lock = threading.Lock()
+        self._spawned: List[_Child] = []
+        self._children: Set[_Child] = set()
+        self._live: Dict[int, _Child] = {}
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "ProcessReaper":
+        return self
+
+    def __exit__(self, *exc_info):
+        abandoned = self.abandon()
+        if abandoned:
+            logger.info(f"Killed {abandoned} unfinished tasks")
+        self.shutdown()
+
+    def spawn(
+        self,
+        cmd: List[str],
+        on_exit: Callable[[ChildExit], Any],
+        timeout: Optional[float] = None,
+        abort_on_stderr: Optional[Callable[[bytes], bool]] = None,
+    ) -> tuple[Future, subprocess.Popen]:
+        spawned_at = time.time()
+        slot = self.placement.acquire() if self.placement is not None else None
+        if slot is not None:
+            cmd = self.placement.command(slot, cmd)
+        try:
+            process = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except Exception:
+            if slot is not None:
+                self.placement.release(slot)
+            raise
+        if slot is not None:
+            self.placement.pin(process.pid, slot)
+        child = _Child(
+            process,
+            on_exit,
+            time.time() + timeout if timeout else None,
+            abort_on_stderr,
+            spawned_at,
+        )
+        child.slot = slot
+        with self._lock:
+            self._spawned.append(child)
+            self._live[process.pid] = child
+        os.write(self._wakeup_w, b"\0")
+        return child.future, process
+
+    def abandon(self) -> int:
+        abandoned = 0
+        with self._lock:
+            for child in self._live.values():
+                process = child.process
+                with process._waitpid_lock:
+                    if child.abandoned or process.returncode is not None:
+                        continue
+                    child.abandoned = True
+                    try:
+                        os.kill(process.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                abandoned += 1
+        if abandoned:
+            os.write(self._wakeup_w, b"\0")
+        return abandoned
+
+    def shutdown(self):
+        with self._lock:
+            self._stopping = True
+        os.write(self._wakeup_w, b"\0")
+        self._thread.join()
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                spawned, self._spawned = self._spawned, []
+                if self._stopping and not spawned and not self._children:
+                    return
+            for child in spawned:
+                self._register(child)
+
+            for key, _ in self._selector.select(self._next_timeout()):
+                if key.data is None:
+                    os.read(self._wakeup_r, 4096)
+                    continue
+                child, stream = key.data
+                if stream == "pidfd":
+                    self._reap(child)
+                else:
+                    self._read(child, key.fileobj, stream)
+
+            now = time.time()
+            for child in list(self._children):
+                if child.exited_at is None:
+                    if child.deadline and now >= child.deadline:
+                        child.timed_out = True
+                        child.deadline = None
+                        child.process.kill()
+                    if child.needs_poll():
+                        self._reap(child)
+                elif child.open_streams and now - child.exited_at >= STREAM_GRACE:
+                    for name in ("stdout", "stderr"):
+                        stream = getattr(child.process, name)
+                        if not stream.closed:
+                            self._close_stream(child, stream, name)
+                if child.exited_at is not None and not child.open_streams:
+                    self._finish(child)
+
+    def _next_timeout(self) -> Optional[float]:
+        now = time.time()
+        timeout = None
+        for child in self._children:
+            if child.exited_at is not None:
+                wake = child.exited_at + STREAM_GRACE
+            elif child.needs_poll():
+                wake = now + 0.05
+            elif child.deadline:
+                wake = child.deadline
+            else:
+                continue
+            remaining = max(wake - now, 0.0)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _register(self, child: _Child):
+        self._children.add(child)
+        self._selector.register(
+            child.process.stdout, selectors.EVENT_READ, (child, "stdout")
+        )
+        self._selector.register(
+            child.process.stderr, selectors.EVENT_READ, (child, "stderr")
+        )
+        if PIDFD_AVAILABLE:
+            try:
+                child.pidfd = os.pidfd_open(child.process.pid)
+                self._selector.register(
+                    child.pidfd, selectors.EVENT_READ, (child, "pidfd")
+                )
+            except OSError:
+                child.pidfd = None
+
+    def _read(self, child: _Child, stream, name: str):
+        tail: LineTail = getattr(child, name)
+        data = os.read(stream.fileno(), 65536)
+        if data:
+            complete = tail.feed(data)
+        else:
+            complete = self._close_stream(child, stream, name)
+        if (
+            name == "stderr"
+            and complete
+            and child.abort_on_stderr
+            and not child.aborted
+            and child.abort_on_stderr(complete)
+        ):
+            child.aborted = True
+            if child.exited_at is None:
+                child.process.kill()
+
+    def _close_stream(self, child: _Child, stream, name: str) -> bytes:
+        self._selector.unregister(stream)
+        stream.close()
+        child.open_streams -= 1
+        return getattr(child, name).close()
+
+    def _reap(self, child: _Child):
+        process = child.process
+        # Hold Popen's own lock so a concurrent poll() from the watchdog
+        # cannot reap the child first and record a bogus exit status.
+        with process._waitpid_lock:
+            if process.returncode is None:
+                try:
+                    pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                except ChildProcessError:
+                    process.returncode = 0
+                else:
+                    if pid:
+                        process.returncode = os.waitstatus_to_exitcode(status)
+                        child.rusage = rusage
+            if process.returncode is None:
+                return
+        child.exited_at = time.time()
+        if child.pidfd is not None:
+            self._selector.unregister(child.pidfd)
+            os.close(child.pidfd)
+            child.pidfd = None
+
+    def _finish(self, child: _Child):
+        self._children.discard(child)
+        with self._lock:
+            self._live.pop(child.process.pid, None)
+        if child.slot is not None:
+            self.placement.release(child.slot)
+        result = ChildExit(
+            returncode=child.process.returncode,
+            stdout=child.stdout.getvalue(),
+            stderr=child.stderr.getvalue(),
+            timed_out=child.timed_out,
+            aborted=child.aborted,
+            abandoned=child.abandoned,
+            rusage=child.rusage,
+            spawned_at=child.spawned_at,
+            spawn_time=child.spawn_time,
+            exited_at=child.exited_at,
+        )
+        try:
+            child.future.set_result(child.on_exit(result))
+        except Exception as e:
+            child.future.set_exception(e)
+
+
+def _pid_exited(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return f.read().rsplit(b")", 1)[1].split()[0] in (b"Z", b"X")
+    except (OSError, IndexError):
+        return True
+
+
+def wait_for_pid(pid: int, timeout: float) -> bool:
+    if PIDFD_AVAILABLE:
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pidfd = None
+        if pidfd is not None:
+            try:
+                poller = select.poll()
+                poller.register(pidfd, select.POLLIN)
+                return bool(poller.poll(timeout * 1000))
+            finally:
+                os.close(pidfd)
+    deadline = time.time() + timeout
+    while not _pid_exited(pid):
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def wait_for_exit(process: subprocess.Popen, timeout: float) -> bool:
+    if process.returncode is not None:
+        return True
+    return wait_for_pid(process.pid, timeout)
+
+
+def resolved_future(fn: Callable[..., Any], *args) -> Future:
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -0,0 +1,37 @@
+import logging
+from typing import Callable, List, Optional
+
+from admission_oom import StaticAdmission
+from metrics_oom import BatchMetrics
+from nonce_trace_oom import NonceTrace
+from profile_oom import FootprintProfile
+from result_store_oom import QualityIndex, ResultStore
+from watchdog_oom import BaseWatchdog
+
+logger = logging.getLogger(__name__)
+
+
+def stop_services(
+    watchdog: BaseWatchdog,
+    admission: StaticAdmission,
+    store: ResultStore,
+    profile: Optional[FootprintProfile] = None,
+    trace: Optional[NonceTrace] = None,
+    metrics: Optional[BatchMetrics] = None,
+    qualities: Optional[QualityIndex] = None,
+):
+    steps: List[Callable[[], None]] = [watchdog.stop]
+    if profile is not None:
+        steps.append(profile.save)
+    if trace is not None:
+        steps.append(trace.close)
+    if metrics is not None:
+        steps.append(metrics.stop)
+    steps += [admission.stop, store.close]
+    if qualities is not None:
+        steps.append(qualities.close)
+    for step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"{step.__qualname__} failed during teardown: {e}")
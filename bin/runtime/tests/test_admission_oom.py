@@ -0,0 +1,98 @@
+import time
+
+from admission_oom import (
+    AdmissionController,
+    StaticAdmission,
+    create_admission_controller,
+)
+
+
+def write_psi(cgroup_dir, avg10: float):
+    (cgroup_dir / "memory.pressure").write_text(
+        f"some avg10={avg10:.2f} avg60=0.00 avg300=0.00 total=0\n"
+        "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+    )
+
+
+def write_events(cgroup_dir, oom: int = 0, high: int = 0, max: int = 0):
+    (cgroup_dir / "memory.events").write_text(
+        f"low 0\nhigh {high}\nmax {max}\noom {oom}\noom_kill {oom}\n"
+    )
+
+
+def fake_cgroup(tmp_path, avg10: float = 0.0):
+    write_psi(tmp_path, avg10)
+    write_events(tmp_path)
+    return tmp_path
+
+
+def test_create_uses_fake_cgroup(tmp_path):
+    assert isinstance(
+        create_admission_controller(8, False, str(tmp_path)), StaticAdmission
+    )
+    fake_cgroup(tmp_path)
+    admission = create_admission_controller(8, False, str(tmp_path))
+    assert isinstance(admission, AdmissionController)
+    assert admission.admit(7) and not admission.admit(8)
+    disabled = create_admission_controller(8, True, str(tmp_path))
+    assert type(disabled) is StaticAdmission
+
+
+def test_shrinks_under_psi_and_grows_back(tmp_path):
+    fake_cgroup(tmp_path)
+    admission = AdmissionController(
+        8, str(tmp_path), shrink_cooldown=0.0, grow_after=0.0
+    )
+    woken = []
+    admission.add_listener(lambda: woken.append(admission.limit))
+    assert not admission.under_pressure()
+
+    write_psi(tmp_path, 50.0)
+    assert admission.under_pressure()
+    admission.shrink()
+    assert admission.limit == 4
+    assert admission.admit(3) and not admission.admit(4)
+
+    write_psi(tmp_path, 0.0)
+    assert not admission.under_pressure()
+    admission.grow()
+    assert admission.limit == 5
+    assert woken == [5]
+
+
+def test_memory_events_count_as_pressure(tmp_path):
+    fake_cgroup(tmp_path)
+    admission = AdmissionController(8, str(tmp_path))
+    write_events(tmp_path, oom=1)
+    assert admission.under_pressure()
+    assert not admission.under_pressure()
+
+
+def test_reclaim_at_limit_does_not_shrink(tmp_path):
+    fake_cgroup(tmp_path)
+    admission = AdmissionController(
+        8, str(tmp_path), poll_interval=0.01, shrink_cooldown=0.0
+    )
+    admission.start()
+    try:
+        for count in range(1, 20):
+            write_events(tmp_path, high=count, max=count * 10)
+            time.sleep(0.02)
+    finally:
+        admission.stop()
+    assert admission.limit == 8
+
+
+def test_loop_polls_fake_cgroup(tmp_path):
+    fake_cgroup(tmp_path, avg10=50.0)
+    admission = AdmissionController(
+        8, str(tmp_path), poll_interval=0.01, shrink_cooldown=0.0
+    )
+    admission.start()
+    try:
+        deadline = time.time() + 2
+        while admission.limit > 1 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        admission.stop()
+    assert admission.limit == 1
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from arbiter_oom import Candidate, OOMArbiter, proc_identity
+from kill_policy_oom import KillPolicy
+from scheduler_oom import PRIORITY_VERIFY, wait_for_pid
+from watchdog_oom import MB, DummyWatchdog, NonceTask
+
+TOTAL = 1000 * MB
+
+
+def write_board(arbiter, owner, tasks, age=0.0):
+    board = {"owner": owner, "t": time.time() - age, "tasks": tasks}
+    with open(f"{arbiter.directory}/{owner}.json", "w") as f:
+        json.dump(board, f)
+
+
+@pytest.fixture
+def arbiter(tmp_path):
+    arbiter = OOMArbiter("ram", str(tmp_path))
+    yield arbiter
+    arbiter.close()
+
+
+@pytest.fixture
+def driver():
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import subprocess, sys; p = subprocess.Popen(['sleep', '30']); "
+            "print(p.pid, flush=True); sys.stdin.read(); p.kill()",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    child = int(process.stdout.readline())
+    yield process.pid, child
+    process.stdin.close()
+    process.wait()
+
+
+def test_plan_ranks_tasks_across_boards(arbiter):
+    other = os.getppid()
+    write_board(
+        arbiter,
+        other,
+        [
+            [1, "runtime", 101, 100 * MB, 1.0, 150.0, 0],
+            [2, "verify", 102, 300 * MB, 1.0, 50.0, 0],
+        ],
+    )
+    write_board(arbiter, 1, [[3, "runtime", 103, 100 * MB, 1.0, 80.0, 0]])
+    policy = KillPolicy(0.80, 0.75)
+    decision = arbiter.plan(policy, 0.84, TOTAL)
+    assert [(c.owner, c.nonce) for c in decision.victims] == [(other, 1)]
+
+    decision = arbiter.plan(policy, 0.95, TOTAL)
+    assert [(c.owner, c.nonce) for c in decision.victims] == [(other, 1), (1, 3)]
+
+
+def test_verify_tasks_are_not_preferred(arbiter, driver):
+    _, pid = driver
+    tasks = [
+        NonceTask(1, Future(), SimpleNamespace(pid=pid), memory=100 * MB),
+        NonceTask(
+            2,
+            Future(),
+            SimpleNamespace(pid=pid + 1),
+            priority=PRIORITY_VERIFY,
+            memory=100 * MB,
+            kind="verify",
+        ),
+    ]
+    arbiter.publish(tasks)
+    decision = arbiter.plan(KillPolicy(0.80, 0.75), 0.84, TOTAL)
+    assert [(c.nonce, c.kind) for c in decision.victims] == [(1, "runtime")]
+
+
+def test_stale_and_dead_boards_are_ignored(arbiter):
+    write_board(arbiter, 1, [[1, "runtime", 101, 100 * MB, 1.0, 50.0, 0]], age=5.0)
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    write_board(arbiter, dead.pid, [[2, "runtime", 102, 100 * MB, 1.0, 50.0, 0]])
+    assert arbiter.candidates() == []
+    assert not os.path.exists(f"{arbiter.directory}/{dead.pid}.json")
+
+
+def test_kill_remote_checks_process_identity(arbiter, driver):
+    owner, pid = driver
+    ppid, start = proc_identity(pid)
+    assert ppid == owner
+    watchdog = DummyWatchdog()
+    watchdog.arbiter = arbiter
+    victim = Candidate(owner, "runtime", 1, pid, 100 * MB, 1.0, 50.0, start)
+
+    recycled = Candidate(owner, "runtime", 1, pid, 100 * MB, 1.0, 50.0, start + 1)
+    watchdog.kill_remote([recycled], arbiter.plan(KillPolicy(0.9, 0.75), 0, TOTAL))
+    assert not wait_for_pid(pid, 0.1)
+
+    foreign = Candidate(1, "runtime", 1, pid, 100 * MB, 1.0, 50.0, start)
+    watchdog.kill_remote([foreign], arbiter.plan(KillPolicy(0.9, 0.75), 0, TOTAL))
+    assert not wait_for_pid(pid, 0.1)
+
+    watchdog.kill_remote([victim], arbiter.plan(KillPolicy(0.9, 0.75), 0, TOTAL))
+    assert wait_for_pid(pid, 2)
+
+
+def test_missing_directory_falls_back_to_local_policy(tmp_path):
+    arbiter = OOMArbiter("ram", str(tmp_path))
+    watchdog = DummyWatchdog()
+    watchdog.arbiter = arbiter
+    shutil.rmtree(tmp_path)
+    watchdog.publish_board([])
+    assert os.path.exists(arbiter.board_path)
+    shutil.rmtree(tmp_path)
+    tmp_path.write_text("")
+    try:
+        assert not watchdog.arbitrate(0.95, TOTAL, [])
+        watchdog.publish_board([])
+    finally:
+        tmp_path.unlink()
+
+
+def test_board_is_published_only_under_pressure_with_peers(arbiter):
+    watchdog = DummyWatchdog()
+    watchdog.arbiter = arbiter
+    arbiter.last_publish = 0.0
+    assert not arbiter.has_peers()
+    assert not watchdog.board_due(0.80)
+
+    write_board(arbiter, os.getppid(), [])
+    assert arbiter.has_peers()
+    assert not watchdog.board_due(0.50)
+    assert watchdog.board_due(0.80)
+
+    watchdog.publish_board([])
+    assert not watchdog.board_due(0.80)
@@ -0,0 +1,26 @@
+import json
+
+from admission_oom import StaticAdmission
+from autoscale_oom import Autoscaler, autoscale_key
+from watchdog_oom import DummyWatchdog
+
+SETTINGS = json.dumps({"challenge_id": "c001", "algorithm_id": "a042"})
+
+
+def test_runtime_and_verify_keep_separate_entries(tmp_path):
+    path = str(tmp_path / "autoscale.json")
+    runtime_key = autoscale_key(SETTINGS, "/opt/a042.so", "runtime")
+    verify_key = autoscale_key(SETTINGS, "/opt/tig-verifier", "verify")
+    assert runtime_key != verify_key
+
+    runtime = Autoscaler(StaticAdmission(16), DummyWatchdog(), runtime_key, path=path)
+    runtime.best_limit, runtime.best_rate = 12, 3.0
+    runtime.save()
+
+    verify = Autoscaler(StaticAdmission(16), DummyWatchdog(), verify_key, path=path)
+    assert verify.limit == 4
+    verify.best_limit, verify.best_rate = 2, 9.0
+    verify.save()
+
+    runtime = Autoscaler(StaticAdmission(16), DummyWatchdog(), runtime_key, path=path)
+    assert runtime.limit == 12
@@ -0,0 +1,82 @@
+import json
+import subprocess
+from concurrent.futures import Future
+
+import pytest
+
+import gpu_oom
+from watchdog_oom import MB, MultiGPUWatchdog, create_watchdog
+
+TOTAL = 10000 * MB
+
+
+def write_devices(path, used, processes=None):
+    devices = [
+        {"used": u * MB, "total": TOTAL, "processes": (processes or {}).get(i, {})}
+        for i, u in enumerate(used)
+    ]
+    path.write_text(json.dumps({"devices": devices}))
+
+
+@pytest.fixture
+def fake_gpus(tmp_path, monkeypatch):
+    path = tmp_path / "gpus.json"
+    monkeypatch.setenv("TIG_POOL_FAKE_GPUS", str(path))
+    monkeypatch.setattr(gpu_oom, "FAKE_GPUS", str(path))
+    return path
+
+
+def create_multi_gpu_watchdog() -> MultiGPUWatchdog:
+    watchdog = create_watchdog(
+        None,
+        0.90,
+        0.75,
+        0.01,
+        False,
+        gpu_ids=[0, 1, 2],
+        shared_sampler=False,
+        arbiter=False,
+    )
+    assert isinstance(watchdog, MultiGPUWatchdog)
+    return watchdog
+
+
+def test_routes_nonces_to_least_loaded_devices(fake_gpus):
+    write_devices(fake_gpus, [1000, 9500, 1000])
+    watchdog = create_multi_gpu_watchdog()
+    picks = []
+    for nonce in range(6):
+        device = watchdog.pick_device()
+        watchdog.register_task(nonce, Future(), device=device)
+        picks.append(device)
+    assert picks == [0, 2, 0, 2, 0, 2]
+    assert watchdog.devices == {0: 0, 1: 2, 2: 0, 3: 2, 4: 0, 5: 2}
+
+    watchdog.unregister_task(0)
+    watchdog.unregister_task(2)
+    assert watchdog.pick_device() == 0
+    watchdog.stop()
+
+
+def test_killed_nonce_is_retried_on_another_device(fake_gpus):
+    write_devices(fake_gpus, [1000, 9500, 1000])
+    watchdog = create_multi_gpu_watchdog()
+    process = subprocess.Popen(["sleep", "30"])
+    try:
+        watchdog.register_task(7, Future(), process, device=0)
+        write_devices(fake_gpus, [9600, 9500, 1000], {0: {str(process.pid): 5000 * MB}})
+        watchdog.start()
+        assert process.wait(timeout=5) == -15
+    finally:
+        watchdog.stop()
+        process.kill()
+        process.wait()
+
+    assert watchdog.unregister_task(7) is None
+    assert watchdog.get_nonces_to_restart() == []
+    watchdog.queue_for_retry(7)
+    assert watchdog.get_pending_restart_count() == 1
+    assert watchdog.get_nonces_to_restart() == [7]
+    assert watchdog.pick_device() == 2
+    watchdog.register_task(7, Future(), device=watchdog.pick_device())
+    assert watchdog.devices[7] == 2
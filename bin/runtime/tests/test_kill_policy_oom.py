@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+from kill_policy_oom import KillPolicy
+
+TOTAL = 1000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def task(nonce: int, memory: int, oom_score: float):
+    return SimpleNamespace(nonce=nonce, memory=memory, oom_score=oom_score)
+
+
+def nonces(decision) -> list:
+    return [t.nonce for t in decision.victims]
+
+
+TASKS = [task(1, 50, 1.0), task(2, 100, 3.0), task(3, 200, 2.0)]
+
+
+def test_no_kill_below_high_watermark():
+    policy = KillPolicy(0.90, 0.75)
+    for usage in (0.10, 0.75, 0.89, 0.90):
+        decision = policy.plan(usage, TOTAL, TASKS)
+        assert decision.victims == []
+        assert decision.projected == usage
+
+
+def test_victims_follow_oom_score_until_low_watermark():
+    policy = KillPolicy(0.90, 0.75)
+    decision = policy.plan(0.92, TOTAL, TASKS)
+    assert nonces(decision) == [2, 3]
+    assert abs(decision.projected - 0.62) < 1e-9
+
+    decision = policy.plan(0.85, TOTAL, TASKS)
+    assert decision.victims == []
+
+    decision = policy.plan(0.99, TOTAL, TASKS)
+    assert nonces(decision) == [2, 3]
+
+    decision = policy.plan(1.10, TOTAL, TASKS)
+    assert nonces(decision) == [2, 3, 1]
+
+
+def test_unknown_memory_kills_one_at_a_time():
+    policy = KillPolicy(0.90, 0.75)
+    tasks = [task(1, 0, 5.0), task(2, 300, 1.0)]
+    decision = policy.plan(0.95, TOTAL, tasks)
+    assert nonces(decision) == [1]
+    assert decision.projected == 0.95
+
+
+def test_hysteresis_over_a_memory_curve():
+    policy = KillPolicy(0.90, 0.75)
+    curve = [0.70, 0.85, 0.91, 0.88, 0.80, 0.89, 0.93]
+    killed = []
+    running = list(TASKS)
+    for usage in curve:
+        decision = policy.plan(usage, TOTAL, running)
+        for victim in decision.victims:
+            running.remove(victim)
+            policy.record_kill()
+        killed.append(nonces(decision))
+    assert killed == [[], [], [2, 3], [], [], [], [1]]
+
+
+def test_budget_limits_kills_per_window():
+    clock = FakeClock()
+    policy = KillPolicy(0.90, 0.75, kill_budget=2, kill_window=5.0, clock=clock)
+    tasks = [task(n, 10, float(n)) for n in range(1, 6)]
+
+    decision = policy.plan(0.99, TOTAL, tasks)
+    assert nonces(decision) == [5, 4]
+    assert decision.budget_exhausted
+    for _ in decision.victims:
+        policy.record_kill()
+
+    clock.now = 4.9
+    decision = policy.plan(0.99, TOTAL, tasks[:3])
+    assert decision.victims == [] and decision.budget_exhausted
+
+    clock.now = 5.0
+    decision = policy.plan(0.99, TOTAL, tasks[:3])
+    assert nonces(decision) == [3, 2]
+
+
+def test_default_budget_is_unlimited():
+    policy = KillPolicy(0.90, 0.75)
+    tasks = [task(n, 10, float(n)) for n in range(1, 31)]
+    for _ in range(100):
+        policy.record_kill()
+    decision = policy.plan(1.0, TOTAL, tasks)
+    assert len(decision.victims) == 25
+    assert not decision.budget_exhausted
@@ -0,0 +1,37 @@
+from scheduler_oom import MAX_LINE_BYTES, LineTail
+
+
+def test_keeps_complete_lines_across_chunks():
+    tail = LineTail()
+    assert tail.feed(b"first li") == b""
+    assert tail.feed(b"ne\nsecond\nthi") == b"first line\nsecond"
+    assert tail.getvalue() == b"first line\nsecond"
+    assert tail.close() == b"thi"
+    assert tail.getvalue() == b"first line\nsecond\nthi"
+    assert tail.close() == b""
+
+
+def test_keeps_only_the_last_lines():
+    tail = LineTail(max_lines=3)
+    tail.feed(b"".join(b"line %d\n" % i for i in range(1000)))
+    tail.feed(b"line 1000\nline 1001\n")
+    assert tail.getvalue() == b"line 999\nline 1000\nline 1001"
+
+
+def test_truncates_long_lines():
+    tail = LineTail()
+    chunk = b"x" * 65536
+    for _ in range(16):
+        assert tail.feed(chunk) == b""
+    assert len(tail._partial) == MAX_LINE_BYTES
+    tail.feed(b"\n" + b"y" * (2 * MAX_LINE_BYTES) + b"\nz")
+    assert [len(line) for line in tail.lines] == [MAX_LINE_BYTES, MAX_LINE_BYTES]
+    assert tail.close() == b"z"
+
+
+def test_memory_stays_bounded_under_chatter():
+    tail = LineTail(max_lines=4)
+    for i in range(10000):
+        tail.feed(b"progress %d\r" % i * 50 + b"\n")
+    assert len(tail.lines) == 4
+    assert sum(len(line) for line in tail.lines) <= 4 * MAX_LINE_BYTES
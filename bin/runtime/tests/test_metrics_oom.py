@@ -0,0 +1,76 @@
+import time
+import urllib.request
+
+import pytest
+
+import metrics_oom
+from metrics_oom import CONTENT_TYPE, BatchMetrics
+from watchdog_oom import DummyWatchdog
+
+
+def parse(body: str) -> dict:
+    samples = {}
+    for line in body.splitlines():
+        if line.startswith("#"):
+            assert line.startswith("# TYPE tig_batch_")
+            continue
+        name, value = line.rsplit(" ", 1)
+        samples[name] = float(value)
+    return samples
+
+
+@pytest.fixture
+def metrics():
+    metrics = BatchMetrics(DummyWatchdog(), "runtime")
+    metrics.serve(0, "127.0.0.1")
+    yield metrics
+    metrics.stop()
+
+
+def scrape(metrics) -> dict:
+    url = f"http://127.0.0.1:{metrics._server.server_port}/metrics"
+    with urllib.request.urlopen(url, timeout=5) as response:
+        assert response.headers["Content-Type"] == CONTENT_TYPE
+        return parse(response.read().decode())
+
+
+def test_serve_exposes_counters_and_histogram(metrics):
+    metrics.track(in_flight=lambda: 3)
+    metrics.record({"stage": "runtime", "outcome": "ok", "wall": 0.2})
+    metrics.record({"stage": "runtime", "outcome": "ok", "wall": 7.0})
+    metrics.record({"stage": "runtime", "outcome": "killed_by_oom", "wall": 1.0})
+    metrics.record({"stage": "runtime", "outcome": "boom", "wall": 1.0})
+    metrics.record({"stage": "runtime", "outcome": "abandoned", "wall": 9.0})
+    samples = scrape(metrics)
+    labels = 'mode="runtime",stage="runtime"'
+    assert samples[f'tig_batch_nonces_total{{{labels},outcome="ok"}}'] == 2
+    assert samples[f'tig_batch_nonces_total{{{labels},outcome="retry"}}'] == 1
+    assert samples[f'tig_batch_nonces_total{{{labels},outcome="error"}}'] == 1
+    assert samples[f'tig_batch_nonces_total{{{labels},outcome="abandoned"}}'] == 1
+    bucket = "tig_batch_nonce_latency_seconds_bucket"
+    assert samples[f'{bucket}{{{labels},le="0.25"}}'] == 1
+    assert samples[f'{bucket}{{{labels},le="10.0"}}'] == 2
+    assert samples[f'{bucket}{{{labels},le="+Inf"}}'] == 2
+    assert samples[f"tig_batch_nonce_latency_seconds_sum{{{labels}}}"] == 7.2
+    assert samples['tig_batch_in_flight{mode="runtime"}'] == 3
+
+
+def test_rate_covers_recent_window(metrics, monkeypatch):
+    monkeypatch.setattr(metrics_oom, "RATE_WINDOW", 10.0)
+    metrics.started_at = time.time() - 100
+    metrics.completions["runtime"].extend([time.time() - 50] * 100)
+    for _ in range(5):
+        metrics.record({"stage": "runtime", "outcome": "ok", "wall": 0.1})
+    metrics.outcomes[("runtime", "ok")] += 100
+    samples = scrape(metrics)
+    rate = samples['tig_batch_nonces_per_second{mode="runtime",stage="runtime"}']
+    assert rate == pytest.approx(0.5)
+
+
+def test_stop_survives_unwritable_textfile(tmp_path, caplog):
+    metrics = BatchMetrics(DummyWatchdog(), "runtime")
+    metrics.start(0, str(tmp_path / "missing" / "tig.prom"))
+    metrics.stop()
+    assert "Cannot write metrics textfile" in caplog.text
+    with pytest.raises(OSError):
+        scrape(metrics)
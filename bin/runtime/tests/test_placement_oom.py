@@ -0,0 +1,114 @@
+import pytest
+
+from placement_oom import (
+    Placement,
+    Slot,
+    build_slots,
+    create_placement,
+    parse_cpulist,
+    read_topology,
+)
+
+NODES = {0: "0-3", 1: "4-7"}
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    for node, cpulist in NODES.items():
+        node_dir = tmp_path / "node" / f"node{node}"
+        node_dir.mkdir(parents=True)
+        (node_dir / "cpulist").write_text(f"{cpulist}\n")
+    for cpu in range(8):
+        topology = tmp_path / "cpu" / f"cpu{cpu}" / "topology"
+        topology.mkdir(parents=True)
+        (topology / "physical_package_id").write_text(f"{cpu // 4}\n")
+        (topology / "core_id").write_text(f"{cpu % 4 // 2}\n")
+    return str(tmp_path)
+
+
+def test_parse_cpulist():
+    assert parse_cpulist("0-2,5,7-8\n") == [0, 1, 2, 5, 7, 8]
+    assert parse_cpulist("") == []
+
+
+def test_read_topology(sysfs):
+    topology = read_topology(sysfs, frozenset(range(8)))
+    assert [(c.cpu, c.node, c.package, c.core) for c in topology] == [
+        (0, 0, 0, 0),
+        (1, 0, 0, 0),
+        (2, 0, 0, 1),
+        (3, 0, 0, 1),
+        (4, 1, 1, 0),
+        (5, 1, 1, 0),
+        (6, 1, 1, 1),
+        (7, 1, 1, 1),
+    ]
+    assert [c.cpu for c in read_topology(sysfs, frozenset({1, 6}))] == [1, 6]
+
+
+def test_read_topology_without_numa_nodes(tmp_path):
+    topology = read_topology(str(tmp_path), frozenset({0, 1}))
+    assert [(c.node, c.package, c.core) for c in topology] == [(0, 0, 0), (0, 0, 1)]
+
+
+def test_slots_spread_over_nodes(sysfs):
+    topology = read_topology(sysfs, frozenset(range(8)))
+    cores = build_slots(topology, "core")
+    assert [(s.cpulist, s.node) for s in cores] == [
+        ("0", 0),
+        ("4", 1),
+        ("2", 0),
+        ("6", 1),
+    ]
+    threads = build_slots(topology, "thread")
+    assert [s.cpulist for s in threads] == ["0", "4", "2", "6", "1", "5", "3", "7"]
+    nodes = build_slots(topology, "node")
+    assert [(s.cpulist, s.node) for s in nodes] == [("0,1,2,3", 0), ("4,5,6,7", 1)]
+
+
+def test_command_prefers_the_slot_node():
+    placement = Placement([Slot(frozenset({0, 1}), 0), Slot(frozenset({4}), 1)])
+    placement.numactl, placement.taskset = "/usr/bin/numactl", "/usr/bin/taskset"
+    slot = placement.slots[1]
+    assert placement.command(slot, ["run"]) == [
+        "/usr/bin/numactl",
+        "--physcpubind=4",
+        "--preferred=1",
+        "--",
+        "run",
+    ]
+    placement.numactl = None
+    assert placement.command(placement.slots[0], ["run"]) == [
+        "/usr/bin/taskset",
+        "--cpu-list",
+        "0,1",
+        "run",
+    ]
+    placement.taskset = None
+    assert placement.command(slot, ["run"]) == ["run"]
+
+
+def test_single_node_does_not_set_a_memory_policy():
+    placement = Placement([Slot(frozenset({0}), 0), Slot(frozenset({1}), 0)])
+    placement.numactl = "/usr/bin/numactl"
+    assert placement.command(placement.slots[0], ["run"]) == [
+        "/usr/bin/numactl",
+        "--physcpubind=0",
+        "--",
+        "run",
+    ]
+
+
+def test_acquire_balances_slots():
+    placement = Placement([Slot(frozenset({0}), 0), Slot(frozenset({1}), 0)])
+    first, second = placement.acquire(), placement.acquire()
+    assert first is not second
+    placement.release(first)
+    assert placement.acquire() is first
+
+
+def test_create_placement(sysfs, monkeypatch):
+    monkeypatch.setattr("os.sched_getaffinity", lambda pid: set(range(8)))
+    assert create_placement("none", sysfs) is None
+    placement = create_placement("core", sysfs)
+    assert len(placement.slots) == 4 and placement.bind_memory
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from result_store_oom import QualityIndex, create_result_store, load_qualities
+
+
+def test_shards_keep_their_own_partials(tmp_path):
+    first = create_result_store("files", str(tmp_path), "0-5")
+    second = create_result_store("files", str(tmp_path), "5-5")
+    first.discard_partials()
+    with open(first.partial_path(1), "w") as f:
+        f.write("{}")
+    second.discard_partials()
+    assert os.path.exists(first.partial_path(1))
+    assert first.report_path("result") != second.report_path("result")
+
+
+@pytest.mark.parametrize("kind", ["files", "segment"])
+def test_close_removes_the_partial_dir(tmp_path, kind):
+    store = create_result_store(kind, str(tmp_path))
+    store.discard_partials()
+    for nonce in (1, 2):
+        with open(store.partial_path(nonce), "w") as f:
+            json.dump({"nonce": nonce}, f)
+    assert store.promote(1)
+    assert not store.promote(3)
+    store.commit(1)
+    store.close()
+    assert not os.path.exists(store.partial_dir)
+    reopened = create_result_store(kind, str(tmp_path))
+    assert list(reopened.iter_computed()) == [1]
+    assert reopened.load(1) == {"nonce": 1}
+    reopened.close()
+
+
+def test_shards_keep_their_own_qualities(tmp_path):
+    first = QualityIndex(str(tmp_path), 0, 5, "0-5")
+    first.set(1, 10)
+    first.close()
+    second = QualityIndex(str(tmp_path), 5, 5, "5-5")
+    second.set(7, 20)
+    second.close()
+    first = QualityIndex(str(tmp_path), 0, 5, "0-5")
+    assert first.get(1) == 10
+    first.close()
+    assert load_qualities(str(tmp_path)) == {1: 10, 7: 20}
+
+
+def test_segment_store_is_not_shared(tmp_path):
+    store = create_result_store("segment", str(tmp_path), "0-5")
+    try:
+        with pytest.raises(RuntimeError):
+            create_result_store("segment", str(tmp_path), "5-5")
+    finally:
+        store.close()
+    create_result_store("segment", str(tmp_path)).close()
+
+
+def commit_records(store, nonces):
+    for nonce in nonces:
+        with open(store.staged_path(nonce), "w") as f:
+            json.dump({"nonce": nonce, "solution": "x" * nonce}, f)
+        store.commit(nonce)
+
+
+def test_segment_recovery_keeps_committed_records(tmp_path):
+    store = create_result_store("segment", str(tmp_path))
+    commit_records(store, [1, 2, 3])
+    committed_size = os.path.getsize(store.segment_path)
+    commit_records(store, [4])
+    store.close()
+
+    with open(store.segment_path, "r+b") as f:
+        f.truncate(committed_size + 7)
+    with open(store.index_path, "r+b") as f:
+        f.truncate(os.path.getsize(store.index_path) - 5)
+
+    store = create_result_store("segment", str(tmp_path))
+    assert sorted(store.index) == [1, 2, 3]
+    assert [store.load(n)["nonce"] for n in (1, 2, 3)] == [1, 2, 3]
+    assert os.path.getsize(store.segment_path) == committed_size
+    commit_records(store, [4])
+    store.close()
+
+    store = create_result_store("segment", str(tmp_path))
+    assert store.load(4) == {"nonce": 4, "solution": "xxxx"}
+    store.close()
+
+
+def test_segment_recovery_reindexes_unindexed_records(tmp_path):
+    store = create_result_store("segment", str(tmp_path))
+    commit_records(store, [1, 2])
+    store.close()
+    os.truncate(store.index_path, 0)
+
+    store = create_result_store("segment", str(tmp_path))
+    assert store.load(2)["nonce"] == 2
+    store.close()
+    assert os.path.getsize(store.index_path) == 2 * store.INDEX_ENTRY.size
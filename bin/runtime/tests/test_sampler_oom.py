@@ -0,0 +1,36 @@
+import os
+import stat
+
+import pytest
+
+import sampler_oom
+from sampler_oom import SharedSampler
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_default_path_is_per_user():
+    assert sampler_oom.SAMPLER_PATH.endswith(f"tig-pool-sampler-{os.getuid()}")
+
+
+def test_sampler_files_are_private(tmp_path):
+    path = tmp_path / "sampler"
+    path.write_bytes(b"")
+    path.chmod(0o666)
+    sampler = SharedSampler(str(path), backend_factory=lambda: None)
+    try:
+        assert sampler.leading
+        assert mode(path) == 0o600
+        assert mode(f"{path}.lock") == 0o600
+    finally:
+        sampler.close()
+
+
+def test_sampler_refuses_symlinks(tmp_path):
+    target = tmp_path / "target"
+    target.write_bytes(b"")
+    (tmp_path / "sampler").symlink_to(target)
+    with pytest.raises(OSError):
+        SharedSampler(str(tmp_path / "sampler"), backend_factory=lambda: None)
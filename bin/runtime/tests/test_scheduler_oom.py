@@ -0,0 +1,107 @@
+import pytest
+
+import batch_tig_runtime_oom
+import scheduler_oom
+from result_store_oom import create_result_store
+from scheduler_oom import ChildExit, ProcessReaper, has_oom_message
+
+STUB_RUNTIME = """#!/bin/sh
+output=""
+while [ $# -gt 0 ]; do
+    [ "$1" = "--output" ] && output="$2"
+    shift
+done
+case "$STUB_CASE" in
+    ok) echo '{{}}' > "$output/7.json" ;;
+    partial) echo '{{' > "$output/7.json"; exit 1 ;;
+    oom) echo "CUDA error: out of memory" >&2; sleep 30 ;;
+    killed) kill -9 $$ ;;
+    fail) echo "bad settings" >&2; exit 2 ;;
+esac
+"""
+
+
+@pytest.fixture(params=[True, False], ids=["pidfd", "wait4"])
+def reaper(request, monkeypatch):
+    monkeypatch.setattr(scheduler_oom, "PIDFD_AVAILABLE", request.param)
+    with ProcessReaper() as reaper:
+        yield reaper
+
+
+def run(reaper: ProcessReaper, cmd, **kwargs) -> ChildExit:
+    future, _ = reaper.spawn(cmd, lambda child: child, **kwargs)
+    return future.result(timeout=10)
+
+
+def test_exit_status_and_output(reaper):
+    child = run(reaper, ["sh", "-c", "echo out; echo err >&2; exit 3"])
+    assert child.returncode == 3
+    assert (child.stdout, child.stderr) == (b"out", b"err")
+    assert child.rusage is not None
+    assert not (child.timed_out or child.aborted or child.abandoned)
+
+
+def test_signal_exit_is_negative(reaper):
+    assert run(reaper, ["sh", "-c", "kill -TERM $$"]).returncode == -15
+
+
+def test_child_that_closes_its_streams_is_still_reaped(reaper):
+    child = run(reaper, ["sh", "-c", "exec >&- 2>&-; sleep 0.2; exit 4"])
+    assert child.returncode == 4
+
+
+def test_timeout_kills_the_child(reaper):
+    child = run(reaper, ["sleep", "30"], timeout=0.2)
+    assert child.timed_out and child.returncode == -9
+
+
+def test_abort_on_stderr(reaper):
+    child = run(
+        reaper,
+        ["sh", "-c", "echo 'CUDA error: out of memory' >&2; sleep 30"],
+        abort_on_stderr=has_oom_message,
+    )
+    assert child.aborted and child.returncode == -9
+
+
+def test_abandon_kills_live_children(reaper):
+    future, process = reaper.spawn(["sleep", "30"], lambda child: child)
+    done, _ = reaper.spawn(["true"], lambda child: child)
+    assert done.result(timeout=10).returncode == 0
+    assert reaper.abandon() == 1
+    child = future.result(timeout=10)
+    assert child.abandoned and child.returncode == -9
+    assert reaper.abandon() == 0
+
+
+def test_exit_closes_unfinished_children():
+    with ProcessReaper() as reaper:
+        future, _ = reaper.spawn(["sleep", "30"], lambda child: child)
+    assert future.result(timeout=10).abandoned
+
+
+@pytest.mark.parametrize(
+    "case, expected",
+    [
+        ("ok", None),
+        ("partial", "exit 1: "),
+        ("oom", "cuda_oom"),
+        ("killed", "killed_by_oom"),
+        ("fail", "exit 2: bad settings"),
+    ],
+)
+def test_runtime_exit_mapping(tmp_path, monkeypatch, case, expected):
+    stub = tmp_path / "tig-pool-runtime"
+    stub.write_text(STUB_RUNTIME.format())
+    stub.chmod(0o755)
+    monkeypatch.setattr(batch_tig_runtime_oom, "RUNTIME_BIN", str(stub))
+    monkeypatch.setenv("STUB_CASE", case)
+    store = create_result_store("files", str(tmp_path))
+    store.discard_partials()
+    with ProcessReaper() as reaper:
+        future, _ = batch_tig_runtime_oom.process_single_nonce(
+            reaper, 7, "{}", "abc", "stub.so", 1, store, stop_on_error=False
+        )
+        assert future.result(timeout=10) == (7, expected)
+    assert store.is_computed(7) == (expected is None)
+    assert not (tmp_path / ".partial" / "7.json").exists()
@@ -0,0 +1,40 @@
+import json
+
+from admission_oom import StaticAdmission
+from profile_oom import FootprintProfile
+from result_store_oom import QualityIndex, create_result_store
+from services_oom import stop_services
+from watchdog_oom import DummyWatchdog
+
+
+class FailingMetrics:
+    def stop(self):
+        raise OSError("textfile is read-only")
+
+
+def test_failed_steps_do_not_skip_the_rest(tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    store = create_result_store("segment", str(output_dir))
+    with open(store.staged_path(1), "w") as f:
+        json.dump({"nonce": 1}, f)
+    store.commit(1)
+    qualities = QualityIndex(str(output_dir), 0, 4)
+    profile = FootprintProfile("c001/a/RAM", "RAM", "/proc/nope/footprints.json")
+    profile.record(64 * 1024 * 1024)
+
+    stop_services(
+        DummyWatchdog(),
+        StaticAdmission(1),
+        store,
+        profile,
+        None,
+        FailingMetrics(),
+        qualities,
+    )
+
+    assert store._segment.closed
+    assert qualities._mmap.closed
+    reopened = create_result_store("segment", str(output_dir))
+    assert reopened.load(1) == {"nonce": 1}
+    reopened.close()
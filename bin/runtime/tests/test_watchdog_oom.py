@@ -0,0 +1,105 @@
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import batch_tig_runtime_oom
+from kill_policy_oom import KillDecision
+from watchdog_oom import MB, DummyWatchdog, RAMWatchdog
+
+STUB_RUNTIME = """#!{executable} -S
+import json, sys, time
+with open({log!r}, "a") as f:
+    f.write(f"{{time.time()}}\\n")
+args = sys.argv[1:]
+if args[2] == "0":
+    time.sleep(1)
+output = args[args.index("--output") + 1]
+with open(f"{{output}}/{{args[2]}}.json", "w") as f:
+    json.dump({{"nonce": int(args[2])}}, f)
+"""
+
+
+def test_kill_leaves_retry_to_the_driver():
+    watchdog = RAMWatchdog()
+    process = subprocess.Popen(["sleep", "30"])
+    future = Future()
+    watchdog.register_task(1, future, process)
+    task = watchdog.active_tasks[1]
+    task.memory = 100 * MB
+    watchdog.kill_tasks(KillDecision(usage=0.95, projected=0.80, victims=[task]))
+    assert process.wait(timeout=2) == -15
+    assert 1 not in watchdog.active_tasks
+    assert watchdog.get_pending_restart_count() == 0
+    watchdog.queue_for_retry(1)
+    assert watchdog.get_pending_restart_count() == 1
+
+
+def test_resuming_the_last_task_wakes_the_driver():
+    watchdog = RAMWatchdog(pressure_action="suspend")
+    process = subprocess.Popen(["sleep", "30"])
+    try:
+        watchdog.register_task(1, Future(), process)
+        task = watchdog.active_tasks[1]
+        woken = []
+        watchdog.add_restart_listener(lambda: woken.append(watchdog.has_suspended()))
+        watchdog.suspend_tasks(KillDecision(usage=0.95, projected=0.80, victims=[task]))
+        assert watchdog.has_suspended()
+        assert watchdog.resume_one()
+        assert not watchdog.has_suspended()
+        assert woken == [False]
+    finally:
+        process.kill()
+        process.wait()
+
+
+class SuspendingWatchdog(DummyWatchdog):
+    def __init__(self):
+        super().__init__()
+        self.suspended = False
+        self.released_at = None
+        self.timer = None
+
+    def register_task(self, nonce, future, process=None, *args, **kwargs):
+        if self.timer is None:
+            self.suspended = True
+            self.timer = threading.Timer(0.5, self.release)
+            self.timer.start()
+
+    def has_suspended(self) -> bool:
+        return self.suspended
+
+    def release(self):
+        self.released_at = time.time()
+        self.suspended = False
+        self._notify_restart_listeners()
+
+
+def test_driver_holds_fresh_nonces_while_tasks_are_suspended(tmp_path, monkeypatch):
+    log = tmp_path / "starts.log"
+    stub = tmp_path / "tig-pool-runtime"
+    stub.write_text(STUB_RUNTIME.format(executable=sys.executable, log=str(log)))
+    stub.chmod(0o755)
+    watchdog = SuspendingWatchdog()
+    monkeypatch.setattr(batch_tig_runtime_oom, "RUNTIME_BIN", str(stub))
+    monkeypatch.setattr(
+        batch_tig_runtime_oom, "create_watchdog", lambda *args: watchdog
+    )
+    completed = batch_tig_runtime_oom.process_runtime_batch(
+        start_nonce=0,
+        num_nonces=4,
+        max_workers=2,
+        settings_json="{}",
+        rand_hash="abc",
+        so_path="stub.so",
+        max_fuel=1,
+        output_dir=str(tmp_path / "out"),
+        disable_profile=True,
+        disable_admission=True,
+    )
+    watchdog.timer.join()
+    assert completed == 4
+    starts = sorted(float(line) for line in log.read_text().split())
+    assert len(starts) == 4
+    assert starts[0] < watchdog.released_at <= starts[1]
@@ -1,11 +1,34 @@
+import json
 import logging
+import os
+import signal
 import subprocess
 import threading
 import time
 from abc import ABC, abstractmethod
 from concurrent.futures import Future
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Set
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, TextIO
+
+from arbiter_oom import (
+    BOARD_INTERVAL,
+    Candidate,
+    OOMArbiter,
+    create_arbiter,
+    open_candidate,
+)
+from gpu_oom import GPUBackend, create_gpu_backend
+from kill_policy_oom import (
+    KILL_BUDGET,
+    KILL_WINDOW,
+    RELEASE_TIMEOUT,
+    RESUME_SETTLE,
+    TERM_GRACE,
+    KillDecision,
+    KillPolicy,
+)
+from sampler_oom import SharedGPUBackend, SharedSampler, get_shared_sampler
+from scheduler_oom import wait_for_exit
 
 logger = logging.getLogger(__name__)
 
@@ -16,18 +39,55 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
-try:
-    from pynvml import (
-        nvmlInit,
-        nvmlShutdown,
-        nvmlDeviceGetHandleByIndex,
-        nvmlDeviceGetMemoryInfo,
-        NVMLError,
-    )
-
-    NVML_AVAILABLE = True
-except ImportError:
-    NVML_AVAILABLE = False
+MB = 1024 * 1024
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def read_process_memory(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "rb") as f:
+            for line in f:
+                if line.startswith(b"Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def find_cgroup_dir(root: str = CGROUP_ROOT) -> Optional[str]:
+    try:
+        with open("/proc/self/cgroup", "r") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    path = f"{root}{line[3:].strip().rstrip('/')}"
+                    if os.path.exists(f"{path}/memory.current"):
+                        return path
+    except OSError:
+        pass
+    return root if os.path.exists(f"{root}/memory.current") else None
+
+
+def read_cgroup_memory(cgroup_dir: str) -> Optional[tuple[int, int]]:
+    try:
+        with open(f"{cgroup_dir}/memory.max", "r") as f:
+            limit = f.read().strip()
+        if limit == "max":
+            return None
+        with open(f"{cgroup_dir}/memory.current", "r") as f:
+            current = int(f.read())
+        with open(f"{cgroup_dir}/memory.stat", "r") as f:
+            for line in f:
+                if line.startswith("inactive_file "):
+                    current -= int(line.split()[1])
+                    break
+        return max(current, 0), int(limit)
+    except (OSError, ValueError):
+        return None
 
 
 @dataclass
@@ -37,6 +97,10 @@ class NonceTask:
     process: Optional[subprocess.Popen] = None
     start_time: float = field(default_factory=time.time)
     priority: int = 0
+    memory: int = 0
+    peak_memory: int = 0
+    suspended: bool = False
+    kind: str = "runtime"
 
     @property
     def age(self) -> float:
@@ -44,7 +108,7 @@ class NonceTask:
 
     @property
     def oom_score(self) -> float:
-        return 1000 / (1 + self.age) + self.priority
+        return (self.memory / MB + 1) / (1 + self.age) / (1 + self.priority)
 
 
 class BaseWatchdog(ABC):
@@ -53,6 +117,10 @@ class BaseWatchdog(ABC):
         high_watermark: float = 0.90,
         low_watermark: float = 0.75,
         check_interval: float = 0.05,
+        trace: Optional[TextIO] = None,
+        kill_budget: int = KILL_BUDGET,
+        kill_window: float = KILL_WINDOW,
+        pressure_action: str = "kill",
     ):
         self.high_watermark = high_watermark
         self.low_watermark = low_watermark
@@ -62,6 +130,19 @@ class BaseWatchdog(ABC):
         self.lock = threading.RLock()
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
+        self._restart_listeners: List[Callable[[], None]] = []
+        self._event_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.policy = KillPolicy(
+            high_watermark, low_watermark, kill_budget, kill_window
+        )
+        self._budget_exhausted = False
+        self.pressure_action = pressure_action
+        self.suspend_policy = KillPolicy(high_watermark, low_watermark, kill_budget=0)
+        self._last_resume = 0.0
+        self.trace = trace
+        self.sample_interval: Optional[float] = None
+        self.arbiter: Optional[OOMArbiter] = None
+        self._arbiter_error: Optional[str] = None
         self.enabled = False
 
     @property
@@ -77,21 +158,78 @@ class BaseWatchdog(ABC):
     def get_memory_info(self) -> tuple[int, int, float]:
         pass
 
+    def get_task_memory(self, pids: Iterable[int]) -> Dict[int, int]:
+        return {pid: read_process_memory(pid) for pid in pids}
+
+    def running_tasks(self) -> List[NonceTask]:
+        with self.lock:
+            return [
+                t
+                for t in self.active_tasks.values()
+                if not t.future.done() and not t.future.cancelled()
+            ]
+
+    def sample_tasks(self) -> List[NonceTask]:
+        running = self.running_tasks()
+        memory = self.get_task_memory(t.process.pid for t in running if t.process)
+        for t in running:
+            if t.process:
+                t.memory = memory.get(t.process.pid, 0)
+                t.peak_memory = max(t.peak_memory, t.memory)
+        return running
+
+    def record_trace(self, tasks: List[NonceTask]):
+        used, total, _ = self.get_memory_info()
+        self.trace.write(
+            json.dumps(
+                {
+                    "t": time.time(),
+                    "used": used,
+                    "total": total,
+                    "tasks": {t.nonce: [round(t.age, 3), t.memory] for t in tasks},
+                }
+            )
+            + "\n"
+        )
+
+    def add_event_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        with self.lock:
+            self._event_listeners.append(callback)
+
+    def emit(self, event: str, **fields):
+        record = {"t": time.time(), "event": event, "memory": self.memory_type}
+        record.update(fields)
+        if self.trace is not None:
+            self.trace.write(json.dumps(record) + "\n")
+        with self.lock:
+            listeners = list(self._event_listeners)
+        for callback in listeners:
+            callback(record)
+
+    def pick_device(self, default: Optional[int] = None) -> Optional[int]:
+        return default
+
     def register_task(
         self,
         nonce: int,
         future: Future,
         process: Optional[subprocess.Popen] = None,
         priority: int = 0,
+        device: Optional[int] = None,
+        kind: str = "runtime",
     ):
         with self.lock:
             self.active_tasks[nonce] = NonceTask(
-                nonce=nonce, future=future, process=process, priority=priority
+                nonce=nonce,
+                future=future,
+                process=process,
+                priority=priority,
+                kind=kind,
             )
 
-    def unregister_task(self, nonce: int):
+    def unregister_task(self, nonce: int) -> Optional[NonceTask]:
         with self.lock:
-            self.active_tasks.pop(nonce, None)
+            return self.active_tasks.pop(nonce, None)
 
     def set_process(self, nonce: int, process: subprocess.Popen):
         with self.lock:
@@ -102,39 +240,253 @@ class BaseWatchdog(ABC):
         with self.lock:
             self.killed_nonces.add(nonce)
 
-    def get_victim(self) -> Optional[NonceTask]:
+    def add_restart_listener(self, callback: Callable[[], None]):
         with self.lock:
-            running = [
-                t
-                for t in self.active_tasks.values()
-                if not t.future.done() and not t.future.cancelled()
-            ]
-            return max(running, key=lambda t: t.oom_score) if running else None
+            self._restart_listeners.append(callback)
 
-    def kill_victim(self) -> bool:
-        victim = self.get_victim()
-        if victim is None:
-            return False
+    def _notify_restart_listeners(self):
+        with self.lock:
+            listeners = list(self._restart_listeners)
+        for callback in listeners:
+            callback()
+
+    def kill_tasks(self, decision: KillDecision):
         used, total, pct = self.get_memory_info()
-        logger.warning(
-            f"[{self.memory_type} OOM] Killing nonce {victim.nonce} (age={victim.age:.1f}s, {used}/{total}MB {pct * 100:.1f}%)"
-        )
-        if victim.process and victim.process.poll() is None:
-            victim.process.terminate()
-            try:
-                victim.process.wait(timeout=0.5)
-            except subprocess.TimeoutExpired:
+        for victim in decision.victims:
+            logger.warning(
+                f"[{self.memory_type} OOM] Killing nonce {victim.nonce} (mem={victim.memory // MB}MB, age={victim.age:.1f}s, score={victim.oom_score:.2f}, {used}/{total}MB {pct * 100:.1f}%, projected {decision.projected * 100:.1f}%)"
+            )
+            self.emit(
+                "kill",
+                nonce=victim.nonce,
+                rss=victim.memory,
+                age=round(victim.age, 3),
+                score=round(victim.oom_score, 3),
+                usage=round(decision.usage, 4),
+                projected=round(decision.projected, 4),
+            )
+            if victim.process and victim.process.returncode is None:
+                victim.process.terminate()
+                if victim.suspended:
+                    self._signal(victim, signal.SIGCONT)
+            self.policy.record_kill()
+        for victim in decision.victims:
+            started = time.time()
+            if victim.process and not wait_for_exit(victim.process, TERM_GRACE):
                 victim.process.kill()
-        victim.future.cancel()
+                wait_for_exit(victim.process, RELEASE_TIMEOUT)
+            self.emit("exit", nonce=victim.nonce, wait=round(time.time() - started, 3))
+            with self.lock:
+                self.active_tasks.pop(victim.nonce, None)
+
+    def await_release(self, decision: KillDecision) -> float:
+        target = max(decision.projected, self.low_watermark)
+        deadline = time.time() + RELEASE_TIMEOUT
+        usage = self.get_memory_usage()
+        while usage > target and time.time() < deadline:
+            if self._stop_event.wait(self.check_interval):
+                break
+            usage = self.get_memory_usage()
+        self.emit("released", usage=round(usage, 4), target=round(target, 4))
+        return usage
+
+    def _signal(self, task: NonceTask, sig: int) -> bool:
+        try:
+            os.kill(task.process.pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def suspend_tasks(self, decision: KillDecision):
+        for victim in decision.victims:
+            if not victim.process or victim.process.returncode is not None:
+                continue
+            if not self._signal(victim, signal.SIGSTOP):
+                continue
+            victim.suspended = True
+            logger.warning(
+                f"[{self.memory_type} OOM] Suspending nonce {victim.nonce} (mem={victim.memory // MB}MB, age={victim.age:.1f}s, projected {decision.projected * 100:.1f}%)"
+            )
+            self.emit(
+                "suspend",
+                nonce=victim.nonce,
+                rss=victim.memory,
+                age=round(victim.age, 3),
+                usage=round(decision.usage, 4),
+                projected=round(decision.projected, 4),
+            )
+
+    def get_suspended(self) -> List[NonceTask]:
         with self.lock:
-            self.active_tasks.pop(victim.nonce, None)
-            self.killed_nonces.add(victim.nonce)
+            return [t for t in self.active_tasks.values() if t.suspended]
+
+    def has_suspended(self) -> bool:
+        with self.lock:
+            return any(t.suspended for t in self.active_tasks.values())
+
+    def resume_one(self) -> bool:
+        suspended = self.get_suspended()
+        if not suspended:
+            return False
+        task = min(suspended, key=lambda t: t.oom_score)
+        task.suspended = False
+        self._last_resume = time.time()
+        if self._signal(task, signal.SIGCONT):
+            logger.info(f"[{self.memory_type} OOM] Resuming nonce {task.nonce}")
+            self.emit("resume", nonce=task.nonce, age=round(task.age, 3))
+        if not self.has_suspended():
+            self._notify_restart_listeners()
+        return True
+
+    def resume_all(self):
+        while self.resume_one():
+            pass
+
+    def enforce(self, usage: float):
+        tasks = self.sample_tasks()
+        total = self.get_memory_info()[1] * MB
+        if self.pressure_action == "suspend":
+            decision = self.suspend_policy.plan(
+                usage, total, [t for t in tasks if not t.suspended]
+            )
+            if decision.victims:
+                self.suspend_tasks(decision)
+                self.await_release(decision)
+                return
+            tasks = [t for t in tasks if t.suspended]
+        if self.arbiter is not None and self.arbitrate(usage, total, tasks):
+            return
+        decision = self.policy.plan(usage, total, tasks)
+        self._check_budget(decision)
+        if decision.victims:
+            self.kill_tasks(decision)
+            self.await_release(decision)
+
+    def _check_budget(self, decision: KillDecision):
+        if decision.budget_exhausted != self._budget_exhausted:
+            self._budget_exhausted = decision.budget_exhausted
+            if decision.budget_exhausted:
+                logger.warning(
+                    f"[{self.memory_type} OOM] Kill budget exhausted ({self.policy.kill_budget} per {self.policy.kill_window:.0f}s), holding"
+                )
+                self.emit("budget_exhausted", usage=round(decision.usage, 4))
+
+    def _arbiter_failed(self, e: OSError):
+        if self._arbiter_error is None:
+            logger.warning(
+                f"[{self.memory_type} OOM] Arbiter unavailable ({e}), using local kill policy"
+            )
+        self._arbiter_error = str(e)
+
+    def _arbiter_ok(self):
+        if self._arbiter_error is not None:
+            logger.info(f"[{self.memory_type} OOM] Arbiter available again")
+            self._arbiter_error = None
+
+    def publish_board(self, tasks: List[NonceTask]):
+        try:
+            self.arbiter.publish(tasks)
+        except OSError as e:
+            self._arbiter_failed(e)
+            return
+        self._arbiter_ok()
+
+    def board_due(self, usage: float) -> bool:
+        return (
+            self.arbiter is not None
+            and usage >= self.low_watermark
+            and time.time() - self.arbiter.last_publish >= BOARD_INTERVAL
+            and self.arbiter.has_peers()
+        )
+
+    def board_tasks(self, usage: float) -> List[NonceTask]:
+        return self.sample_tasks()
+
+    def arbitrate(self, usage: float, total: int, tasks: List[NonceTask]) -> bool:
+        try:
+            self.arbiter.publish(tasks)
+            with self.arbiter.round() as leading:
+                if leading:
+                    self.kill_planned(
+                        self.arbiter.plan(self.policy, usage, total), tasks
+                    )
+        except OSError as e:
+            self._arbiter_failed(e)
+            return False
+        self._arbiter_ok()
         return True
 
+    def kill_planned(self, decision: KillDecision, tasks: List[NonceTask]):
+        self._check_budget(decision)
+        if not decision.victims:
+            return
+        local = {t.process.pid: t for t in tasks if t.process is not None}
+        own = [
+            local[c.pid]
+            for c in decision.victims
+            if c.owner == self.arbiter.owner and c.pid in local
+        ]
+        remote = [c for c in decision.victims if c.owner != self.arbiter.owner]
+        self.kill_remote(remote, decision)
+        if own:
+            self.kill_tasks(KillDecision(decision.usage, decision.projected, own))
+        self.await_release(decision)
+
+    def kill_remote(self, victims: List[Candidate], decision: KillDecision):
+        handles = []
+        for victim in victims:
+            handle = open_candidate(victim)
+            if handle is None:
+                logger.info(
+                    f"[{self.memory_type} OOM] Nonce {victim.nonce} of batch {victim.owner} already exited"
+                )
+                continue
+            logger.warning(
+                f"[{self.memory_type} OOM] Killing nonce {victim.nonce} of batch {victim.owner} (mem={victim.memory // MB}MB, age={victim.age:.1f}s, kind={victim.kind}, score={victim.oom_score:.2f}, projected {decision.projected * 100:.1f}%)"
+            )
+            self.emit(
+                "kill",
+                nonce=victim.nonce,
+                owner=victim.owner,
+                kind=victim.kind,
+                rss=victim.memory,
+                age=round(victim.age, 3),
+                score=round(victim.oom_score, 3),
+                usage=round(decision.usage, 4),
+                projected=round(decision.projected, 4),
+            )
+            try:
+                handle.signal(signal.SIGTERM)
+                handle.signal(signal.SIGCONT)
+            except OSError as e:
+                if not isinstance(e, ProcessLookupError):
+                    logger.warning(
+                        f"[{self.memory_type} OOM] Cannot signal nonce {victim.nonce} of batch {victim.owner}: {e}"
+                    )
+                handle.close()
+                continue
+            self.policy.record_kill()
+            handles.append(handle)
+        for handle in handles:
+            if not handle.wait(TERM_GRACE):
+                try:
+                    handle.signal(signal.SIGKILL)
+                except OSError:
+                    pass
+            handle.close()
+
     def get_nonces_to_restart(self) -> list[int]:
         with self.lock:
-            if self.get_memory_usage() < self.low_watermark and self.killed_nonces:
-                return [self.killed_nonces.pop()]
+            if (
+                self.get_memory_usage() < self.low_watermark
+                and self.killed_nonces
+                and not self.get_suspended()
+            ):
+                nonce = self.killed_nonces.pop()
+                logger.info(
+                    f"[{self.memory_type} OOM] Retrying nonce {nonce} ({len(self.killed_nonces)} still queued)"
+                )
+                return [nonce]
             return []
 
     def get_pending_restart_count(self) -> int:
@@ -142,12 +494,27 @@ class BaseWatchdog(ABC):
             return len(self.killed_nonces)
 
     def _watchdog_loop(self):
+        last_sample = 0.0
         while not self._stop_event.is_set():
-            if self.get_memory_usage() > self.high_watermark:
-                while self.get_memory_usage() > self.low_watermark:
-                    if not self.kill_victim():
-                        break
-                    time.sleep(0.1)
+            usage = self.get_memory_usage()
+            if self.trace is not None:
+                self.record_trace(self.sample_tasks())
+            elif (
+                self.sample_interval
+                and time.time() - last_sample >= self.sample_interval
+            ):
+                self.sample_tasks()
+                last_sample = time.time()
+            if self.board_due(usage):
+                self.publish_board(self.board_tasks(usage))
+            if usage > self.high_watermark:
+                self.enforce(usage)
+            elif usage < self.low_watermark:
+                if self.get_suspended():
+                    if time.time() - self._last_resume >= RESUME_SETTLE:
+                        self.resume_one()
+                elif self.get_pending_restart_count() > 0:
+                    self._notify_restart_listeners()
             self._stop_event.wait(self.check_interval)
 
     def start(self):
@@ -164,6 +531,11 @@ class BaseWatchdog(ABC):
         self._stop_event.set()
         if self._thread:
             self._thread.join(timeout=2)
+        self.resume_all()
+        if self.arbiter is not None:
+            self.arbiter.close()
+        if self.trace is not None:
+            self.trace.close()
 
 
 class RAMWatchdog(BaseWatchdog):
@@ -172,24 +544,53 @@ class RAMWatchdog(BaseWatchdog):
         high_watermark: float = 0.90,
         low_watermark: float = 0.75,
         check_interval: float = 0.05,
+        trace: Optional[TextIO] = None,
+        cgroup_dir: Optional[str] = None,
+        kill_budget: int = KILL_BUDGET,
+        kill_window: float = KILL_WINDOW,
+        pressure_action: str = "kill",
+        sampler: Optional[SharedSampler] = None,
     ):
-        super().__init__(high_watermark, low_watermark, check_interval)
-        self.enabled = PSUTIL_AVAILABLE
+        super().__init__(
+            high_watermark,
+            low_watermark,
+            check_interval,
+            trace,
+            kill_budget,
+            kill_window,
+            pressure_action,
+        )
+        self.cgroup_dir = cgroup_dir or find_cgroup_dir()
+        if self.cgroup_dir and read_cgroup_memory(self.cgroup_dir) is None:
+            self.cgroup_dir = None
+        self.sampler = sampler
+        self.enabled = PSUTIL_AVAILABLE or self.cgroup_dir is not None
 
     @property
     def memory_type(self) -> str:
         return "RAM"
 
     def get_memory_usage(self) -> float:
-        return psutil.virtual_memory().percent / 100.0 if self.enabled else 0.0
+        return self.get_memory_info()[2]
 
     def get_memory_info(self) -> tuple[int, int, float]:
         if not self.enabled:
             return (0, 0, 0.0)
+        if self.cgroup_dir:
+            cgroup = read_cgroup_memory(self.cgroup_dir)
+            if cgroup is not None:
+                used, total = cgroup
+                return (used // MB, total // MB, used / total)
+        shared = self.sampler.ram() if self.sampler else None
+        if shared is not None:
+            used, total = shared
+            return (used // MB, total // MB, used / total)
+        if not PSUTIL_AVAILABLE:
+            return (0, 0, 0.0)
         mem = psutil.virtual_memory()
         return (
-            mem.used // (1024 * 1024),
-            mem.total // (1024 * 1024),
+            mem.used // MB,
+            mem.total // MB,
             mem.percent / 100.0,
         )
 
@@ -201,51 +602,188 @@ class VRAMWatchdog(BaseWatchdog):
         high_watermark: float = 0.90,
         low_watermark: float = 0.75,
         check_interval: float = 0.05,
+        trace: Optional[TextIO] = None,
+        kill_budget: int = KILL_BUDGET,
+        kill_window: float = KILL_WINDOW,
+        backend: Optional[GPUBackend] = None,
     ):
-        super().__init__(high_watermark, low_watermark, check_interval)
+        super().__init__(
+            high_watermark,
+            low_watermark,
+            check_interval,
+            trace,
+            kill_budget,
+            kill_window,
+        )
         self.gpu_id = gpu_id
-        self.handle = None
-        if NVML_AVAILABLE:
-            try:
-                nvmlInit()
-                self.handle = nvmlDeviceGetHandleByIndex(gpu_id)
-                self.enabled = True
-            except NVMLError:
-                pass
+        self._owns_backend = backend is None
+        self.backend = create_gpu_backend() if backend is None else backend
+        self.enabled = (
+            self.backend is not None and self.backend.memory_info(gpu_id) is not None
+        )
 
     @property
     def memory_type(self) -> str:
         return "VRAM"
 
     def get_memory_usage(self) -> float:
-        if not self.enabled or self.handle is None:
-            return 0.0
-        try:
-            info = nvmlDeviceGetMemoryInfo(self.handle)
-            return info.used / info.total
-        except NVMLError:
-            return 0.0
+        return self.get_memory_info()[2]
 
     def get_memory_info(self) -> tuple[int, int, float]:
-        if not self.enabled or self.handle is None:
+        if not self.enabled:
             return (0, 0, 0.0)
-        try:
-            info = nvmlDeviceGetMemoryInfo(self.handle)
-            return (
-                info.used // (1024 * 1024),
-                info.total // (1024 * 1024),
-                info.used / info.total,
-            )
-        except NVMLError:
+        info = self.backend.memory_info(self.gpu_id)
+        if info is None or not info[1]:
             return (0, 0, 0.0)
+        used, total = info
+        return (used // MB, total // MB, used / total)
+
+    def get_task_memory(self, pids: Iterable[int]) -> Dict[int, int]:
+        if not self.enabled:
+            return {}
+        return self.backend.process_memory(self.gpu_id, pids)
 
     def stop(self):
         super().stop()
-        if self.enabled:
-            try:
-                nvmlShutdown()
-            except NVMLError:
-                pass
+        if self._owns_backend and self.backend is not None:
+            self.backend.close()
+
+
+class MultiGPUWatchdog(BaseWatchdog):
+    def __init__(
+        self,
+        gpu_ids: List[int],
+        high_watermark: float = 0.90,
+        low_watermark: float = 0.75,
+        check_interval: float = 0.05,
+        kill_budget: int = KILL_BUDGET,
+        kill_window: float = KILL_WINDOW,
+        backend: Optional[GPUBackend] = None,
+    ):
+        self.backend = backend
+        self.watchdogs: Dict[int, VRAMWatchdog] = {
+            gpu_id: VRAMWatchdog(
+                gpu_id,
+                high_watermark,
+                low_watermark,
+                check_interval,
+                kill_budget=kill_budget,
+                kill_window=kill_window,
+                backend=backend,
+            )
+            for gpu_id in gpu_ids
+        }
+        super().__init__(high_watermark, low_watermark, check_interval)
+        self.devices: Dict[int, int] = {}
+        self.enabled = all(w.enabled for w in self.watchdogs.values())
+
+    @property
+    def memory_type(self) -> str:
+        return "VRAM"
+
+    @property
+    def sample_interval(self) -> Optional[float]:
+        return next(iter(self.watchdogs.values())).sample_interval
+
+    @sample_interval.setter
+    def sample_interval(self, value: Optional[float]):
+        for watchdog in self.watchdogs.values():
+            watchdog.sample_interval = value
+
+    def get_memory_usage(self) -> float:
+        return max(w.get_memory_usage() for w in self.watchdogs.values())
+
+    def get_memory_info(self) -> tuple[int, int, float]:
+        used = total = 0
+        for watchdog in self.watchdogs.values():
+            device_used, device_total, _ = watchdog.get_memory_info()
+            used += device_used
+            total += device_total
+        return (used, total, used / total if total else 0.0)
+
+    def pick_device(self, default: Optional[int] = None) -> Optional[int]:
+        def load(gpu_id: int) -> tuple[bool, int, float]:
+            watchdog = self.watchdogs[gpu_id]
+            usage = watchdog.get_memory_usage()
+            with watchdog.lock:
+                running = len(watchdog.active_tasks)
+            return (usage >= watchdog.high_watermark, running, usage)
+
+        return min(self.watchdogs, key=load)
+
+    def register_task(
+        self,
+        nonce: int,
+        future: Future,
+        process: Optional[subprocess.Popen] = None,
+        priority: int = 0,
+        device: Optional[int] = None,
+        kind: str = "runtime",
+    ):
+        if device not in self.watchdogs:
+            device = self.pick_device()
+        with self.lock:
+            self.devices[nonce] = device
+        self.watchdogs[device].register_task(
+            nonce, future, process, priority, kind=kind
+        )
+
+    def unregister_task(self, nonce: int) -> Optional[NonceTask]:
+        with self.lock:
+            device = self.devices.pop(nonce, None)
+        if device is None:
+            return None
+        return self.watchdogs[device].unregister_task(nonce)
+
+    def set_process(self, nonce: int, process: subprocess.Popen):
+        with self.lock:
+            device = self.devices.get(nonce)
+        if device is not None:
+            self.watchdogs[device].set_process(nonce, process)
+
+    def queue_for_retry(self, nonce: int):
+        for watchdog in self.watchdogs.values():
+            with watchdog.lock:
+                if nonce in watchdog.killed_nonces:
+                    return
+        self.watchdogs[self.pick_device()].queue_for_retry(nonce)
+
+    def add_restart_listener(self, callback: Callable[[], None]):
+        for watchdog in self.watchdogs.values():
+            watchdog.add_restart_listener(callback)
+
+    def add_event_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        for watchdog in self.watchdogs.values():
+            watchdog.add_event_listener(callback)
+
+    def get_nonces_to_restart(self) -> list[int]:
+        target = self.watchdogs[self.pick_device()]
+        if target.get_memory_usage() >= target.low_watermark:
+            return []
+        for gpu_id, watchdog in self.watchdogs.items():
+            with watchdog.lock:
+                if not watchdog.killed_nonces:
+                    continue
+                nonce = watchdog.killed_nonces.pop()
+            logger.info(
+                f"[VRAM OOM] Retrying nonce {nonce} on GPU {target.gpu_id} (killed on GPU {gpu_id})"
+            )
+            return [nonce]
+        return []
+
+    def get_pending_restart_count(self) -> int:
+        return sum(w.get_pending_restart_count() for w in self.watchdogs.values())
+
+    def start(self):
+        for watchdog in self.watchdogs.values():
+            watchdog.trace = self.trace
+            watchdog.start()
+
+    def stop(self):
+        for watchdog in self.watchdogs.values():
+            watchdog.stop()
+        if self.backend is not None:
+            self.backend.close()
 
 
 class DummyWatchdog(BaseWatchdog):
@@ -268,11 +806,13 @@ class DummyWatchdog(BaseWatchdog):
         future: Future,
         process: Optional[subprocess.Popen] = None,
         priority: int = 0,
+        device: Optional[int] = None,
+        kind: str = "runtime",
     ):
         pass
 
-    def unregister_task(self, nonce: int):
-        pass
+    def unregister_task(self, nonce: int) -> Optional[NonceTask]:
+        return None
 
     def set_process(self, nonce: int, process: subprocess.Popen):
         pass
@@ -294,14 +834,67 @@ class DummyWatchdog(BaseWatchdog):
 
 
 def create_watchdog(
-    gpu_id: Optional[int], high: float, low: float, interval: float, disable: bool
+    gpu_id: Optional[int],
+    high: float,
+    low: float,
+    interval: float,
+    disable: bool,
+    trace_path: Optional[str] = None,
+    kill_budget: int = KILL_BUDGET,
+    kill_window: float = KILL_WINDOW,
+    pressure_action: str = "kill",
+    gpu_ids: Optional[List[int]] = None,
+    shared_sampler: bool = True,
+    arbiter: bool = True,
 ) -> BaseWatchdog:
     if disable:
         return DummyWatchdog()
-    if gpu_id is not None:
-        return (
-            VRAMWatchdog(gpu_id, high, low, interval)
-            if NVML_AVAILABLE
-            else DummyWatchdog()
+    sampler = get_shared_sampler() if shared_sampler else None
+    if (gpu_id is not None or gpu_ids) and pressure_action != "kill":
+        logger.warning("Suspending does not release VRAM, using kill policy")
+    if gpu_ids and len(gpu_ids) > 1:
+        watchdog = MultiGPUWatchdog(
+            gpu_ids,
+            high,
+            low,
+            interval,
+            kill_budget=kill_budget,
+            kill_window=kill_window,
+            backend=SharedGPUBackend(sampler) if sampler else create_gpu_backend(),
+        )
+        if arbiter:
+            for child in watchdog.watchdogs.values():
+                child.arbiter = create_arbiter(f"vram{child.gpu_id}")
+    elif gpu_id is not None:
+        watchdog = VRAMWatchdog(
+            gpu_id,
+            high,
+            low,
+            interval,
+            kill_budget=kill_budget,
+            kill_window=kill_window,
+            backend=SharedGPUBackend(sampler) if sampler else None,
+        )
+        watchdog._owns_backend = True
+        if not watchdog.enabled:
+            watchdog.stop()
+            return DummyWatchdog()
+        if arbiter:
+            watchdog.arbiter = create_arbiter(f"vram{gpu_id}")
+    else:
+        watchdog = RAMWatchdog(
+            high,
+            low,
+            interval,
+            kill_budget=kill_budget,
+            kill_window=kill_window,
+            pressure_action=pressure_action,
+            sampler=sampler,
         )
-    return RAMWatchdog(high, low, interval) if PSUTIL_AVAILABLE else DummyWatchdog()
+        if not watchdog.enabled:
+            return DummyWatchdog()
+        if arbiter:
+            watchdog.arbiter = create_arbiter("ram")
+    if trace_path and watchdog.enabled:
+        watchdog.trace = open(trace_path, "a", buffering=1)
+    return watchdog